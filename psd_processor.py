@@ -3,30 +3,64 @@
 PSD Layer Extraction Tool
 
 Recursively scans for Photoshop (PSD) files, copies each to an output directory
-using SHA256 to avoid duplicates (renaming if hashes differ), creates a folder 
+using a content hash (BLAKE3 if installed, else SHA256) to avoid duplicates (renaming if hashes differ), creates a folder 
 per PSD, extracts all layers as PNG (layer1.png, layer2.png, ...), logs 
 conversions, and allows resuming from the last scanned position for incremental runs.
 """
 
 import argparse
+import atexit
 import hashlib
+import importlib.util
+import io
 import json
 import logging
+import mmap
 import os
+import posixpath
+import queue
 import shutil
+import signal
+import ssl
+import stat
 import sys
+import threading
 import zipfile
 
 import multiprocessing
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import chain
 from pathlib import Path
-from typing import Dict, Set, Optional, List, Tuple
+from typing import Callable, Dict, Set, Optional, List, Tuple, Iterator, Union
+
+# psd_tools (and Pillow with it) is slow to import and only needed where
+# layers are extracted; _import_psd_tools loads it on first use
+PSDImage = None
 
 try:
-    from psd_tools import PSDImage
+    import blake3
 except ImportError:
-    print("Error: psd-tools library not found. Please install it with: pip install psd-tools")
-    sys.exit(1)
+    blake3 = None
+
+# ISA-L's deflate is several times faster than zlib's at low levels and is a
+# drop-in replacement; _use_isal_deflate switches zipfile over to it
+try:
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
+
+# clonefile(2) makes copy-on-write clones on APFS; shutil only uses fcopyfile,
+# which copies the data
+_clonefile = None
+if sys.platform == "darwin":
+    try:
+        import ctypes
+        _clonefile = ctypes.CDLL(None, use_errno=True).clonefile
+        _clonefile.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32)
+        _clonefile.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _clonefile = None
 
 
 # Configure logging
@@ -40,11 +74,83 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Read size for hashing; large enough that hashlib releases the GIL per update
+HASH_BLOCK_SIZE = 1 << 20
+
+# Content hash used for new state. No security property is needed, so use
+# BLAKE3 (SIMD + multithreaded) when available and fall back to SHA256;
+# existing state keeps the algorithm it was written with unless --hasher says otherwise
+HASH_ALGORITHM = "blake3" if blake3 is not None else "sha256"
+HASH_ALGORITHMS = ("sha256", "blake3")
+
+# Files between HASH_BLOCK_SIZE and this size are hashed through mmap, avoiding
+# the copy into Python buffers; larger ones are read in chunks so 32-bit
+# address spaces aren't exhausted. Pool workers never use mmap (see _hash_file)
+MMAP_MAX_SIZE = 1 << 30
+
+# zlib level for layer PNGs; Pillow defaults to 6, which spends most of the
+# save time in DEFLATE for roughly 10% smaller files
+PNG_COMPRESS_LEVEL = 1
+
+# Characters not allowed in file names on Windows (and '/' everywhere),
+# including control characters, as a str.translate table
+_SANITIZE_TRANS = str.maketrans(dict.fromkeys('<>:"/\\|?*' + ''.join(map(chr, range(32))), '_'))
+
+# Output formats for extracted layers: name -> (extension, Pillow format, save options)
+LAYER_FORMATS = {
+    'png': ('.png', 'PNG', {}),
+    'png-fast': ('.png', 'PNG', {'compress_level': PNG_COMPRESS_LEVEL, 'optimize': False}),
+    'webp': ('.webp', 'WEBP', {'lossless': True, 'quality': 0, 'method': 0}),
+    'webp-lossy': ('.webp', 'WEBP', {'quality': 90, 'method': 0}),
+}
+DEFAULT_LAYER_FORMAT = 'png-fast'
+
+# Threads used to render/encode the layers of a single PSD; topil() and PNG
+# encoding spend most of their time in numpy/zlib with the GIL released
+LAYER_THREADS = min(8, os.cpu_count() or 1)
+
+# Archive entries that are already compressed are stored as-is; deflating a
+# PNG again costs a full zlib pass for next to no size gain. Everything else
+# (the copied PSD) is deflated at ZIP_COMPRESS_LEVEL, unless --store-psd
+ZIP_STORED_SUFFIXES = ('.png', '.webp')
+ZIP_COMPRESS_LEVEL = 1
+
+# Journal records between fsyncs; a crash loses at most this many entries
+# from disk (they are rehashed next run), fsyncing each one would dominate
+# for small files
+JOURNAL_FSYNC_INTERVAL = 64
+
+# Per-thread BytesIO reused for encoding layers destined for an archive
+_encode_buffers = threading.local()
+
+# Log pool progress every this many completed files
+PROGRESS_INTERVAL = 100
+
+# Threads used to scan top-level input subdirectories concurrently; readdir
+# releases the GIL, so this mostly hides filesystem (e.g. network) latency
+SCAN_THREADS = min(32, (os.cpu_count() or 1) * 4)
+
+# First line of allFiles.txt: latest mtime (ns) of the input directory and its
+# subdirectories when the list was built; the cached list is rescanned once
+# any of them has changed since. An output directory directly inside the input
+# directory is left out, since every run writes to it. When the output
+# directory (or the state file) is the input directory itself, each run
+# changes that mtime and the list is rebuilt every time.
+FILE_LIST_MTIME_HEADER = "# mtime="
+
+# Scans finding fewer PSD files than this don't create allFiles.txt (an
+# existing list is still updated); walking such a tree again costs next to nothing
+MIN_CACHE_SIZE = 64
+
+# Batches of scanned paths that may wait between the scan thread and
+# process_all before the scan blocks
+SCAN_QUEUE_SIZE = 4096
+
 
 class PSDProcessor:
     """Main class for processing PSD files."""
     
-    def __init__(self, input_dir: str, output_dir: str, state_file: str = "psd_state.json", no_copy: bool = False, refresh_list: bool = False, update_list_only: bool = False):
+    def __init__(self, input_dir: str, output_dir: str, state_file: str = "psd_state.json", no_copy: bool = False, refresh_list: bool = False, update_list_only: bool = False, layer_format: str = DEFAULT_LAYER_FORMAT, hash_algorithm: str = 'auto', force_hash: bool = False, no_zip: bool = False, store_psd: bool = False, min_cache_size: int = MIN_CACHE_SIZE):
         """
         Initialize the PSD processor.
         
@@ -52,69 +158,292 @@ class PSDProcessor:
             input_dir: Directory to scan for PSD files
             output_dir: Directory to output processed files
             state_file: JSON file to track processing state for resume capability
+            layer_format: Image format for extracted layers (key of LAYER_FORMATS)
+            hash_algorithm: Content hash used for deduplication (one of HASH_ALGORITHMS), or
+                'auto' for the one recorded in the existing state, HASH_ALGORITHM for new state
+            force_hash: Rehash every file instead of trusting recorded size/mtime
+            no_zip: Keep extracted layers in directories instead of archives
+            store_psd: Store PSD copies in archives without compression
+            min_cache_size: Fewest scanned files for which a new allFiles.txt is created
         """
         self.input_dir = Path(input_dir).resolve()
         self.output_dir = Path(output_dir).resolve()
+        # str forms for the per-file hot paths, which work on plain str paths
+        self._input_str = os.fspath(self.input_dir)
+        self._input_prefix = os.path.join(self._input_str, "")
+        self._output_str = os.fspath(self.output_dir)
         self.state_file = Path(state_file).resolve()
+        self.journal_file = _journal_path(self.state_file)
         self.no_copy = no_copy
         self.refresh_list = refresh_list
         self.update_list_only = update_list_only
+        self.layer_format = layer_format
+        self.hash_algorithm = hash_algorithm
+        self.force_hash = force_hash
+        self.no_zip = no_zip
+        self.store_psd = store_psd
         self.file_list_path = self.output_dir / "allFiles.txt"
+        self.min_cache_size = min_cache_size
         
         # Create output directory if it doesn't exist
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
         # State tracking
-        self.processed_files: Set[str] = set()
+        # resolved path -> (size, mtime_ns, hash) as seen when it was processed;
+        # None for entries migrated from the old list format (needs rehash)
+        self.processed_files: Dict[str, Optional[Tuple[int, int, str]]] = {}
         self.file_hashes: Dict[str, str] = {}  # hash -> output_filename
         self.name_counters: Dict[str, int] = {}  # base_name -> counter for incremental naming
         
+        # Each processed file is appended to a journal; the full state file is
+        # only rewritten (and the journal cleared) when state is flushed
+        self._journal = None
+        self._dirty_count = 0
+        
         # Load previous state if exists
         self._load_state()
         
+        # Reverse index of file_hashes values for O(1) name lookups
+        self._used_output_names: Set[str] = set(self.file_hashes.values())
+        
     def _load_state(self):
         """Load processing state from JSON file."""
         if self.state_file.exists():
             try:
                 with open(self.state_file, 'r') as f:
                     state = json.load(f)
-                    self.processed_files = set(state.get('processed_files', []))
+                    processed = state.get('processed_files', {})
+                    if isinstance(processed, list):
+                        # Old format recorded paths only; rehash these on next encounter
+                        processed = dict.fromkeys(processed)
                     self.file_hashes = state.get('file_hashes', {})
+                    # json.load gives every entry its own list and hash string;
+                    # store tuples sharing one str per hash (duplicates and
+                    # file_hashes keys) to cut memory on large trees
+                    hashes = {h: h for h in self.file_hashes}
+                    self.processed_files = {
+                        path: None if entry is None else (entry[0], entry[1], hashes.setdefault(entry[2], entry[2]))
+                        for path, entry in processed.items()
+                    }
+                    # State files without an algorithm were written with SHA256
+                    state_algorithm = state.get('hash_algorithm', 'sha256')
+                    if self.hash_algorithm == 'auto' and _hash_algorithm_available(state_algorithm):
+                        # Keep existing hashes usable rather than switching
+                        # to the preferred algorithm and losing deduplication
+                        self.hash_algorithm = state_algorithm
+                        if state_algorithm != HASH_ALGORITHM:
+                            logger.info(f"Using {state_algorithm} as recorded in the state file; "
+                                        f"pass --hasher {HASH_ALGORITHM} to switch")
+                    if self.hash_algorithm == 'auto':
+                        # Recorded algorithm not installed
+                        self.hash_algorithm = HASH_ALGORITHM
+                    if state_algorithm != self.hash_algorithm:
+                        logger.warning(
+                            f"State hashes use {state_algorithm}, now using {self.hash_algorithm}; "
+                            f"duplicates of previously processed content will not be detected"
+                        )
+                        self.file_hashes = {}
                     self.name_counters = state.get('name_counters', {})
                 logger.info(f"Loaded state: {len(self.processed_files)} previously processed files")
             except Exception as e:
                 logger.warning(f"Failed to load state file: {e}")
+        
+        self._replay_journal()
+        if self.hash_algorithm == 'auto':
+            # Fresh state: nothing to stay compatible with
+            self.hash_algorithm = HASH_ALGORITHM
+        
+    def _replay_journal(self):
+        """Apply journal entries written since the state file was last saved."""
+        if not self.journal_file.exists():
+            return
+        replayed = 0
+        mismatched = 0
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Partial last line from an interrupted write
+                        break
+                    if self.hash_algorithm == 'auto' and _hash_algorithm_available(record.get('hash_algorithm')):
+                        # No state file yet: follow the interrupted run's algorithm
+                        self.hash_algorithm = record['hash_algorithm']
+                    entry = tuple(record['entry'])
+                    self.processed_files[record['path']] = entry
+                    # As with the state file, hashes from another algorithm
+                    # (e.g. a crashed run with a different --hasher) can't
+                    # identify duplicates; unlabelled records are of unknown origin
+                    if record.get('hash_algorithm') == self.hash_algorithm:
+                        self.file_hashes[entry[2]] = record['output_name']
+                    else:
+                        mismatched += 1
+                    if 'counter' in record:
+                        stem, counter = record['counter']
+                        self.name_counters[stem] = max(counter, self.name_counters.get(stem, -1))
+                    replayed += 1
+        except Exception as e:
+            logger.warning(f"Failed to replay state journal: {e}")
+        if mismatched:
+            logger.warning(
+                f"{mismatched} journal entries were not hashed with {self.hash_algorithm}; "
+                f"duplicates of their content will not be detected"
+            )
+        if replayed:
+            logger.info(f"Replayed {replayed} journal entries from interrupted run")
+            # Fold the replayed entries into the state file on the next flush
+            self._dirty_count += replayed
                 
     def _save_state(self):
         """Save processing state to JSON file."""
         try:
-            state = {
-                'processed_files': list(self.processed_files),
-                'file_hashes': self.file_hashes,
-                'name_counters': self.name_counters
-            }
-            with open(self.state_file, 'w') as f:
-                json.dump(state, f, indent=2)
+            # Write to a temp file and swap it in so an interrupted save
+            # never leaves a truncated state file behind
+            tmp_file = self.state_file.with_suffix(".tmp")
+            with open(tmp_file, 'w') as f:
+                # Stream entry by entry rather than encoding the whole state
+                # into one string first
+                f.write('{"processed_files":')
+                _write_json_object(f, self.processed_files)
+                f.write(',"hash_algorithm":' + json.dumps(self.hash_algorithm))
+                f.write(',"file_hashes":')
+                _write_json_object(f, self.file_hashes)
+                f.write(',"name_counters":')
+                _write_json_object(f, self.name_counters)
+                f.write('}')
+                # The journal is deleted below, so the snapshot must be on disk first
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_file.replace(self.state_file)
+            
+            # Everything in the journal is now part of the state file
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self.journal_file.exists():
+                self.journal_file.unlink()
+            self._dirty_count = 0
             logger.debug("State saved successfully")
         except Exception as e:
             logger.error(f"Failed to save state: {e}")
             
-    def _calculate_sha256(self, file_path: Path) -> str:
+    def _stat_with_key(self, psd_path: Union[str, Path]) -> Tuple[str, os.stat_result]:
+        """
+        Stat a file and get its state key (resolved path).
+        
+        Scanned paths are built from the resolved input directory without
+        following directory symlinks, so unless the file itself is a symlink
+        they are canonical already and the realpath lookup (an lstat per path
+        component) can be skipped.
+        
+        Args:
+            psd_path: Path to the file
+            
+        Returns:
+            (file_key, stat result of the file)
+        """
+        st = os.lstat(psd_path)
+        path_str = str(psd_path)
+        if not stat.S_ISLNK(st.st_mode) and path_str.startswith(self._input_prefix):
+            return path_str, st
+        return _resolve(os.fspath(psd_path)), os.stat(psd_path)
+    
+    def _is_unchanged(self, file_key: str, st: os.stat_result) -> bool:
         """
-        Calculate SHA256 hash of a file.
+        Check whether a file was already processed and hasn't changed since.
+        
+        Args:
+            file_key: Resolved path of the file
+            st: Current stat result of the file
+            
+        Returns:
+            True if size and mtime match the recorded entry (always False
+            with force_hash)
+        """
+        if self.force_hash:
+            return False
+        entry = self.processed_files.get(file_key)
+        return entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns
+            
+    def _record_processed(self, file_key: str, st: os.stat_result, file_hash: str, output_name: str, stem: Optional[str] = None):
+        """
+        Record a processed file in memory and append it to the state journal.
+        
+        Appending keeps each update O(1) instead of rewriting the whole state file.
+        
+        Args:
+            file_key: Resolved path of the file
+            st: Stat result taken before the file was hashed
+            file_hash: Content hash of the file
+            output_name: Output name the content is stored under
+            stem: Name counter key, when a new output name was assigned
+        """
+        entry = (st.st_size, st.st_mtime_ns, file_hash)
+        self.processed_files[file_key] = entry
+        self.file_hashes[file_hash] = output_name
+        self._used_output_names.add(output_name)
+        
+        record = {'path': file_key, 'entry': entry, 'output_name': output_name, 'hash_algorithm': self.hash_algorithm}
+        if stem is not None:
+            record['counter'] = [stem, self.name_counters[stem]]
+        try:
+            if self._journal is None:
+                self._journal = open(self.journal_file, 'a', encoding='utf-8')
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+            if (self._dirty_count + 1) % JOURNAL_FSYNC_INTERVAL == 0:
+                os.fsync(self._journal.fileno())
+        except Exception as e:
+            logger.error(f"Failed to write state journal: {e}")
+        self._dirty_count += 1
+            
+    def _flush_state(self):
+        """Save state if there are unsaved changes."""
+        if self._dirty_count:
+            self._save_state()
+    
+    def compact_state(self):
+        """Fold the journal into a fresh state file snapshot and remove it."""
+        self._save_state()
+        logger.info(f"State compacted: {len(self.processed_files)} processed files")
+            
+    def _calculate_content_hash(self, file_path: Path) -> str:
+        """
+        Calculate the content hash (self.hash_algorithm) of a file.
         
         Args:
             file_path: Path to the file
             
         Returns:
-            Hexadecimal SHA256 hash string
+            Hexadecimal hash string
+        """
+        return _hash_file(file_path, self.hash_algorithm)
+    
+    def _hash_and_copy(self, src: Path, dst: Path) -> str:
+        """
+        Copy a file while calculating its content hash, reading it only once.
+        
+        Args:
+            src: Source file
+            dst: Destination file (overwritten)
+            
+        Returns:
+            Hexadecimal hash string
         """
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            # Read in chunks to handle large files
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        file_hash = _new_hasher(self.hash_algorithm)
+        buffer = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buffer)
+        with open(src, "rb") as rf, open(dst, "wb") as wf:
+            while True:
+                n = rf.readinto(buffer)
+                if not n:
+                    break
+                file_hash.update(view[:n])
+                wf.write(view[:n])
+        # Preserve timestamps and mode like shutil.copy2
+        shutil.copystat(src, dst)
+        return file_hash.hexdigest()
     
     def _find_psd_files(self) -> list:
         """
@@ -123,39 +452,82 @@ class PSDProcessor:
         Returns:
             List of Path objects for found PSD files
         """
-        psd_files = []
+        return list(map(Path, self._find_psd_paths()))
+    
+    def _find_psd_paths(self, on_batch: Optional[Callable[[List[str]], None]] = None) -> List[str]:
+        """
+        Like _find_psd_files, but returns plain str paths.
         
+        process_all uses this so files that are skipped never get a Path object.
+        
+        Args:
+            on_batch: Called with each batch of paths, in order, as soon as it
+                is found (the whole list at once when loaded from cache)
+        
+        Returns:
+            List of paths (as str) of found PSD files
+        """
         # Check if we should use cached list
         if not self.refresh_list and self.file_list_path.exists():
             logger.info(f"Loading file list from cache: {self.file_list_path}")
             try:
-                with open(self.file_list_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        path_str = line.strip()
-                        if path_str:
-                            psd_files.append(Path(path_str))
-                logger.info(f"Loaded {len(psd_files)} files from cache")
-                return psd_files
+                # One read and a C-level split instead of a per-line loop;
+                # splitlines also accepts lists written with \r\n
+                with open(self.file_list_path, 'r', encoding='utf-8', newline='') as f:
+                    lines = f.read().splitlines()
+                # Lists written before the header existed are trusted as-is
+                stamp = None
+                if lines and lines[0].startswith(FILE_LIST_MTIME_HEADER):
+                    stamp = int(lines[0][len(FILE_LIST_MTIME_HEADER):])
+                    del lines[0]
+                if stamp is not None and _top_level_mtime(self._input_str, self._output_str) > stamp:
+                    logger.info("Input directory changed since the file list was saved. Rescanning...")
+                else:
+                    psd_files = [line for line in lines if line]
+                    logger.info(f"Loaded {len(psd_files)} files from cache")
+                    if on_batch is not None:
+                        on_batch(psd_files)
+                    return psd_files
             except Exception as e:
                 logger.warning(f"Failed to load file list cache: {e}. Rescanning...")
         
-        # Perform recursive scan
+        # Perform recursive scan; the stamp is taken first, so changes made
+        # while scanning invalidate the list on the next run
         logger.info("Scanning directory recursively...")
-        for root, dirs, files in os.walk(self.input_dir):
-            for file in files:
-                if file.lower().endswith('.psd'):
-                    psd_files.append(Path(root) / file)
-                    
+        try:
+            header = f"{FILE_LIST_MTIME_HEADER}{_top_level_mtime(self._input_str, self._output_str)}\n"
+        except OSError:
+            header = ""
+        scanned = []
+        for batch in _iter_psd_batches(self._input_str):
+            if on_batch is not None:
+                on_batch(batch)
+            scanned.extend(batch)
+        
+        # Rescanning a small tree is cheaper than keeping a list for it, so no
+        # new list is created; an existing one (e.g. from --update-list-only)
+        # is still rewritten so it doesn't go stale
+        if (len(scanned) < self.min_cache_size and not self.update_list_only
+                and not self.file_list_path.exists()):
+            return scanned
+        
         # Save to cache
         try:
-            with open(self.file_list_path, 'w', encoding='utf-8') as f:
-                for path in psd_files:
-                    f.write(f"{path}\n")
-            logger.info(f"Saved {len(psd_files)} files to cache: {self.file_list_path}")
+            # Encode once and hand the whole list to write(2) directly,
+            # bypassing the text and buffer layers of open()
+            data = (header + "".join(path + "\n" for path in scanned)).encode('utf-8')
+            fd = os.open(self.file_list_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            logger.info(f"Saved {len(scanned)} files to cache: {self.file_list_path}")
         except Exception as e:
             logger.warning(f"Failed to save file list cache: {e}")
             
-        return psd_files
+        return scanned
     
     def _get_output_name(self, file_hash: str, original_name: str) -> str:
         """
@@ -164,40 +536,47 @@ class PSDProcessor:
         the same name but different content.
         
         Args:
-            file_hash: SHA256 hash of the file
+            file_hash: Content hash of the file
             original_name: Original filename
             
         Returns:
             Output filename
         """
         # Check if we've seen this exact hash before (true duplicate)
-        if file_hash in self.file_hashes:
-            existing_name = self.file_hashes[file_hash]
+        existing_name = self.file_hashes.get(file_hash)
+        if existing_name is not None:
             logger.debug(f"Duplicate content detected: {original_name} matches existing {existing_name}")
             return existing_name
         
-        # Get base name without extension
-        name_without_ext = Path(original_name).stem
-        
-        # Initialize counter if first time seeing this name
-        if name_without_ext not in self.name_counters:
-            self.name_counters[name_without_ext] = -1  # Will increment to 0 on first use
+        name_without_ext = _output_stem(original_name)
+        output_name, counter = self._next_output_name(name_without_ext)
+        self.name_counters[name_without_ext] = counter
+        self._used_output_names.add(output_name)
+        return output_name
+    
+    def _next_output_name(self, name_without_ext: str, reserved: Set[str] = frozenset()) -> Tuple[str, int]:
+        """
+        Find the next free output name for a base name, without claiming it.
         
-        # Generate output name with appropriate suffix
-        while True:
-            self.name_counters[name_without_ext] += 1
-            counter = self.name_counters[name_without_ext]
+        Args:
+            name_without_ext: Base name (see _output_stem)
+            reserved: Names already handed out in this run but not yet recorded
             
-            if counter == 0:
-                output_name = f"{name_without_ext}.psd"
-            else:
-                output_name = f"{name_without_ext}-{counter}.psd"
+        Returns:
+            (output name, counter value it uses)
+        """
+        # Generate output name with appropriate suffix; -1 means first use
+        counter = self.name_counters.get(name_without_ext, -1)
+        while True:
+            counter += 1
+            output_name = f"{name_without_ext}.psd" if counter == 0 else f"{name_without_ext}-{counter}.psd"
+            if output_name in reserved:
+                continue
             
             # Check if this name is available (not an external file)
-            output_path = self.output_dir / output_name
-            if not output_path.exists() or output_name in self.file_hashes.values():
+            if output_name in self._used_output_names or not os.path.exists(os.path.join(self._output_str, output_name)):
                 # Name is available (doesn't exist or is one of our tracked files)
-                return output_name
+                return output_name, counter
             # Otherwise, loop and try next counter value
     
     def _sanitize_filename(self, name: str) -> str:
@@ -210,11 +589,7 @@ class PSDProcessor:
         Returns:
             Sanitized string
         """
-        # Replace invalid characters with underscore
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            name = name.replace(char, '_')
-        return name.strip()
+        return _sanitize_filename_worker(name)
 
     def _extract_layers_recursive(self, layer, output_dir: Path, counter: Dict[str, int]) -> int:
         """
@@ -228,48 +603,10 @@ class PSDProcessor:
         Returns:
             Number of layers extracted
         """
-        count = 0
-        
-        # Handle groups/folders
-        if layer.is_group():
-            # Create subdirectory for the group
-            group_name = self._sanitize_filename(layer.name)
-            group_dir = output_dir / group_name
-            group_dir.mkdir(parents=True, exist_ok=True)
-            
-            for child in layer:
-                count += self._extract_layers_recursive(child, group_dir, counter)
-            return count
-            
-        # Handle normal layers
-        if hasattr(layer, 'topil') and layer.visible:
-            try:
-                layer_image = layer.topil()
-                if layer_image:
-                    # Generate unique filename based on layer name
-                    base_name = self._sanitize_filename(layer.name)
-                    if not base_name:
-                        base_name = "unnamed_layer"
-                        
-                    # Ensure uniqueness within this directory
-                    if base_name not in counter:
-                        counter[base_name] = 0
-                    else:
-                        counter[base_name] += 1
-                        
-                    if counter[base_name] == 0:
-                        layer_filename = f"{base_name}.png"
-                    else:
-                        layer_filename = f"{base_name}_{counter[base_name]}.png"
-                        
-                    layer_path = output_dir / layer_filename
-                    layer_image.save(layer_path, 'PNG')
-                    count += 1
-                    logger.debug(f"Extracted layer: {layer_path.name}")
-            except Exception as e:
-                logger.warning(f"Failed to extract layer {layer.name}: {e}")
-                
-        return count
+        extension, image_format, save_options = LAYER_FORMATS[self.layer_format]
+        jobs = []
+        _extract_layers_recursive_worker(layer, output_dir, counter, jobs, extension)
+        return sum(_save_layer_worker(child, path, image_format, save_options) for child, path in jobs)
 
     def _extract_layers(self, psd_path: Path, layer_dir: Path) -> int:
         """
@@ -282,46 +619,70 @@ class PSDProcessor:
         Returns:
             Number of layers extracted
         """
-        return extract_layers_from_psd(psd_path, layer_dir)
+        return extract_layers_from_psd(psd_path, layer_dir, layer_format=self.layer_format)
 
-    def process_file(self, psd_path: Path) -> bool:
+    def process_file(self, psd_path: Path, file_key: Optional[str] = None) -> bool:
         """
         Process a single PSD file.
         
         Args:
             psd_path: Path to the PSD file
+            file_key: Pre-computed resolved path, if the caller already has it
             
         Returns:
             True if processing was successful, False otherwise
         """
-        # Convert to string for consistent state tracking
-        file_key = str(psd_path.resolve())
-        
-        # Skip if already processed
-        if file_key in self.processed_files:
-            logger.info(f"Skipping already processed file: {psd_path.name}")
-            return True
+        tmp_path = None
         
         try:
+            if file_key is None:
+                file_key, st = self._stat_with_key(psd_path)
+            else:
+                st = psd_path.stat()
+            
+            # Skip if already processed and unchanged since
+            if self._is_unchanged(file_key, st):
+                logger.info(f"Skipping already processed file: {psd_path.name}")
+                return True
+            
             logger.info(f"Processing: {psd_path}")
             
-            # Calculate hash
-            file_hash = self._calculate_sha256(psd_path)
-            logger.debug(f"SHA256: {file_hash}")
+            # Calculate hash; when copying, copy speculatively in the same pass
+            # so the file is only read once
+            if self.no_copy:
+                tmp_path = None
+                file_hash = self._calculate_content_hash(psd_path)
+            else:
+                tmp_path = self.output_dir / f"{psd_path.name}.tmp"
+                file_hash = self._hash_and_copy(psd_path, tmp_path)
+            logger.debug(f"{self.hash_algorithm}: {file_hash}")
+            
+            # With force_hash, a file whose content matches its recorded hash
+            # is unchanged even though the stat check was bypassed
+            entry = self.processed_files.get(file_key)
+            if entry is not None and entry[2] == file_hash and file_hash in self.file_hashes:
+                logger.info(f"Skipping unchanged file (hash matches): {psd_path.name}")
+                if tmp_path is not None:
+                    tmp_path.unlink()
+                self._record_processed(file_key, st, file_hash, self.file_hashes[file_hash])
+                return True
             
             # Determine output filename
             output_name = self._get_output_name(file_hash, psd_path.name)
-            output_path = self.output_dir / output_name
+            output_path = os.path.join(self._output_str, output_name)
             
             # Check if this is a duplicate (same hash)
-            if file_hash in self.file_hashes:
+            is_new = file_hash not in self.file_hashes
+            if not is_new:
                 logger.info(f"Duplicate detected (same hash): {psd_path.name}")
                 logger.info(f"Original file: {self.file_hashes[file_hash]}")
+                if tmp_path is not None:
+                    tmp_path.unlink()
             else:
 
-                # Copy PSD file to output directory unless disabled
-                if not self.no_copy:
-                    shutil.copy2(psd_path, output_path)
+                # Move the speculative copy into place unless copying is disabled
+                if tmp_path is not None:
+                    tmp_path.replace(output_path)
                     logger.info(f"Copied to: {output_path}")
                 else:
                     logger.info(f"Skipping copy (no-copy enabled). Output name reserved: {output_name}")
@@ -330,7 +691,7 @@ class PSDProcessor:
                 self.file_hashes[file_hash] = output_name
             
             # Create layer extraction directory
-            layer_dir_name = Path(output_name).stem + "_layers"
+            layer_dir_name = os.path.splitext(output_name)[0] + "_layers"
             layer_dir = self.output_dir / layer_dir_name
             
             # Extract layers
@@ -339,141 +700,556 @@ class PSDProcessor:
             logger.info(f"Extracted {layer_count} layers")
             
             # Mark as processed
-            self.processed_files.add(file_key)
-            
-            # Save state after each file
-            self._save_state()
+            stem = os.path.splitext(psd_path.name)[0] if is_new else None
+            self._record_processed(file_key, st, file_hash, output_name, stem)
             
             return True
             
         except Exception as e:
             logger.error(f"Failed to process {psd_path}: {e}")
+            if tmp_path is not None and tmp_path.exists():
+                tmp_path.unlink()
             return False
     
+    def _scan_into(self, batches: queue.Queue):
+        """
+        Scan thread for process_all: put each batch from _find_psd_paths on
+        the queue, followed by None, or by the exception if the scan failed.
+        """
+        try:
+            self._find_psd_paths(batches.put)
+        except Exception as e:
+            batches.put(e)
+        else:
+            batches.put(None)
+    
+    def _iter_changed(self, batches: queue.Queue, file_info: Dict, counts: Dict[str, int]) -> Iterator[Path]:
+        """
+        Yield the scanned files that are new or changed since they were processed.
+        
+        Args:
+            batches: Queue filled by _scan_into
+            file_info: Filled with psd_path -> (file_key, stat) for each yielded file
+            counts: 'found', 'skipped' and 'missing' counters, updated as files arrive
+        """
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            counts['found'] += len(batch)
+            for path_str in batch:
+                try:
+                    file_key, st = self._stat_with_key(path_str)
+                except OSError as e:
+                    # Stale entry in a cached file list, or unreadable file
+                    logger.warning(f"Cannot stat {path_str}: {e}")
+                    counts['missing'] += 1
+                    continue
+                if self._is_unchanged(file_key, st):
+                    counts['skipped'] += 1
+                else:
+                    psd_path = Path(path_str)
+                    file_info[psd_path] = (file_key, st)
+                    yield psd_path
+    
+    def _log_scan_counts(self, counts: Dict[str, int], to_process: int):
+        """Log how many files were found, skipped and left to process."""
+        logger.info(f"Found {counts['found']} PSD file(s)")
+        logger.info(f"Skipping {counts['skipped']} already processed files")
+        logger.info(f"Processing {to_process} files...")
+    
     def process_all(self):
         """Process all PSD files in the input directory using multiprocessing."""
         logger.info(f"Scanning for PSD files in: {self.input_dir}")
         
-        # If update_list_only is set, force refresh
+        # If update_list_only is set, force refresh and stop after the scan
         if self.update_list_only:
             self.refresh_list = True
-            
-        psd_files = self._find_psd_files()
-        total_files = len(psd_files)
-        
-        if self.update_list_only:
+            self._find_psd_paths()
             logger.info("List updated. Exiting as requested by --update-list-only.")
             return
         
-        if total_files == 0:
-            logger.warning("No PSD files found")
+        # The scan runs in its own thread and hands over batches of paths, so
+        # new files are filtered and hashed while the rest of the tree is
+        # still being listed instead of after it
+        scan_queue = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+        scanner = threading.Thread(target=self._scan_into, args=(scan_queue,), name="psd-scan", daemon=True)
+        scanner.start()
+        
+        file_info = {}  # psd_path -> (file_key, stat) in scan order, so each path is resolved once
+        counts = {'found': 0, 'skipped': 0, 'missing': 0}
+        changed = self._iter_changed(scan_queue, file_info, counts)
+        first = next(changed, None)
+        
+        if first is None:
+            if counts['found'] == 0:
+                logger.warning("No PSD files found")
+            else:
+                self._log_scan_counts(counts, 0)
             return
         
-        logger.info(f"Found {total_files} PSD file(s)")
+        if scanner.is_alive():
+            # Still scanning: the number of files isn't known yet
+            hash_inputs = chain([first], changed)
+            total = None
+            logger.info("Hashing new files while the scan continues...")
+        else:
+            # The whole list is already here (cached, or a quick scan)
+            hash_inputs = [first, *changed]
+            total = len(hash_inputs)
+            self._log_scan_counts(counts, total)
+
+        # Stage A hashes in the pool; names are then assigned here in list order
+        # (deterministic, and no shared state between workers); stage B exports
+        # Use slightly fewer processes than CPU count to leave room for system
+        cpu_count = max(1, multiprocessing.cpu_count() - 1)
+        # Every process already keeps a core busy, so only a couple of layer
+        # threads each; enough to overlap I/O and let a large PSD at the tail
+        # of the run use the cores that idle workers leave free
+        layer_threads = max(2, min(LAYER_THREADS, 2 * multiprocessing.cpu_count() // cpu_count))
+        logger.info(f"Starting pool with {cpu_count} processes, {layer_threads} layer threads each")
         
-        # Filter out already processed files
-        files_to_process = []
-        skipped_count = 0
+        hash_func = partial(hash_file_worker, hash_algorithm=self.hash_algorithm)
+        export_func = partial(
+            export_file_worker,
+            output_dir=self.output_dir,
+            no_copy=self.no_copy,
+            layer_format=self.layer_format,
+            no_zip=self.no_zip,
+            layer_threads=layer_threads,
+            store_psd=self.store_psd
+        )
         
-        for psd_path in psd_files:
-            if str(psd_path.resolve()) in self.processed_files:
-                skipped_count += 1
-            else:
-                files_to_process.append(psd_path)
+        success_count = 0
+        failed_count = 0
+        
+        # Flush any unsaved progress if the interpreter exits without
+        # unwinding this frame (the finally below covers everything else)
+        atexit.register(self._flush_state)
+        try:
+            with multiprocessing.Pool(processes=cpu_count, initializer=_worker_init) as pool:
+                # Hashing jobs are short, so send them in chunks to cut IPC
+                # round-trips; around 8 chunks per process keeps the load balanced.
+                # While the scan is still running, files go out one by one
+                chunksize = max(1, total // (cpu_count * 8)) if total else 1
+                hashes = {}
+                results = pool.imap_unordered(partial(_worker_task, hash_func), hash_inputs, chunksize=chunksize)
+                for done, (psd_path, file_hash) in enumerate(results, start=1):
+                    if file_hash is None:
+                        failed_count += 1
+                    else:
+                        hashes[psd_path] = file_hash
+                    _log_progress("Hashed", done, total)
+                
+                scanner.join()
+                failed_count += counts['missing']
+                files_to_process = list(file_info)
+                if total is None:
+                    self._log_scan_counts(counts, len(files_to_process))
                 
-        logger.info(f"Skipping {skipped_count} already processed files")
-        logger.info(f"Processing {len(files_to_process)} files...")
+                jobs = []  # (psd_path, output_name) of new content to export
+                pending = {}  # hash -> [stem, paths of duplicates, counter] for content being exported
+                # Names of pending exports; they only go into name_counters once
+                # exported, so an interrupted or failed export doesn't use up its name
+                reserved = set()
+                for psd_path in files_to_process:
+                    file_hash = hashes.get(psd_path)
+                    if file_hash is None:
+                        continue
+                    if file_hash in pending:
+                        pending[file_hash][1].append(psd_path)
+                        continue
+                    file_key, st = file_info[psd_path]
+                    if file_hash in self.file_hashes:
+                        # Duplicate of already exported content
+                        self._record_processed(file_key, st, file_hash, self.file_hashes[file_hash])
+                        success_count += 1
+                        continue
+                    stem = _output_stem(psd_path.name)
+                    output_name, counter = self._next_output_name(stem, reserved)
+                    reserved.add(output_name)
+                    pending[file_hash] = [stem, [], counter]
+                    jobs.append((psd_path, output_name))
+                
+                # Handle results as workers finish rather than in submission order,
+                # so one slow PSD doesn't hold back bookkeeping for the rest.
+                # Exports vary from milliseconds to minutes, so they are sent one
+                # at a time (chunksize 1) for load balancing
+                results = pool.imap_unordered(partial(_export_task, export_func), jobs)
+                for done, ((psd_path, output_name), ok) in enumerate(results, start=1):
+                    _log_progress("Exported", done, len(jobs))
+                    file_hash = hashes[psd_path]
+                    stem, duplicates, counter = pending.pop(file_hash)
+                    if not ok:
+                        failed_count += 1 + len(duplicates)
+                        continue
+                    self.name_counters[stem] = max(counter, self.name_counters.get(stem, -1))
+                    # Record the stat taken before hashing, so a file modified
+                    # mid-run is picked up again next time
+                    for path in [psd_path] + duplicates:
+                        file_key, st = file_info[path]
+                        self._record_processed(file_key, st, file_hash, output_name, stem)
+                        stem = None
+                        success_count += 1
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; saving progress before exiting")
+            raise
+        finally:
+            # Final state update, also reached on interrupt or error
+            self._flush_state()
+            atexit.unregister(self._flush_state)
+            # Symlinks and mounts may change before the next run
+            _resolve.cache_clear()
         
-        if not files_to_process:
-            return
+        # Final summary
+        logger.info("\n" + "="*50)
+        logger.info("Processing Summary:")
+        logger.info(f"Total files found: {counts['found']}")
+        logger.info(f"Successfully processed: {success_count}")
+        logger.info(f"Already processed (skipped): {counts['skipped']}")
+        logger.info(f"Failed: {failed_count}")
+        logger.info("="*50)
 
-        # Multiprocessing setup
-        with multiprocessing.Manager() as manager:
-            shared_hashes = manager.dict(self.file_hashes)
-            shared_counters = manager.dict(self.name_counters)
-            shared_processed = manager.dict() # Not strictly needed for logic, but good for tracking
-            lock = manager.Lock()
-            
-            # Prepare arguments
-            func = partial(
-                process_file_worker,
-                input_dir=self.input_dir,
-                output_dir=self.output_dir,
-                no_copy=self.no_copy,
-                shared_hashes=shared_hashes,
-                shared_counters=shared_counters,
-                shared_processed=shared_processed,
-                lock=lock
-            )
-            
-            # Run pool
-            # Use slightly fewer processes than CPU count to leave room for system
-            cpu_count = max(1, multiprocessing.cpu_count() - 1)
-            logger.info(f"Starting pool with {cpu_count} processes")
-            
-            success_count = 0
-            failed_count = 0
-            
-            with multiprocessing.Pool(processes=cpu_count) as pool:
-                results = []
-                for i, psd_path in enumerate(files_to_process, start=1):
-                    logger.info(f"Queuing: {psd_path.name}")
-                    results.append((psd_path, pool.apply_async(func, (psd_path,))))
-                
-                # Wait for results and update local state
-                for psd_path, res in results:
-                    try:
-                        if res.get():
-                            success_count += 1
-                            self.processed_files.add(str(psd_path.resolve()))
-                        else:
-                            failed_count += 1
-                    except Exception as e:
-                        logger.error(f"Worker error for {psd_path}: {e}")
-                        failed_count += 1
-                        
-                    # Periodically save state (optional, but good practice)
-                    if success_count % 10 == 0:
-                        self.file_hashes = dict(shared_hashes)
-                        self.name_counters = dict(shared_counters)
-                        self._save_state()
-
-            # Final state update
-            self.file_hashes = dict(shared_hashes)
-            self.name_counters = dict(shared_counters)
-            self._save_state()
-            
-            # Final summary
-            logger.info("\n" + "="*50)
-            logger.info("Processing Summary:")
-            logger.info(f"Total files found: {total_files}")
-            logger.info(f"Successfully processed: {success_count}")
-            logger.info(f"Already processed (skipped): {skipped_count}")
-            logger.info(f"Failed: {failed_count}")
-            logger.info("="*50)
+def _output_stem(original_name: str) -> str:
+    """Base name used for output naming: the file name without its extension."""
+    # Inputs are almost always *.psd
+    if len(original_name) > 4 and original_name[-4:].lower() == '.psd':
+        return original_name[:-4]
+    return os.path.splitext(original_name)[0]
+
+def _log_progress(stage: str, done: int, total: Optional[int]):
+    """Log pool progress every PROGRESS_INTERVAL completions and at the end (total None if not known yet)."""
+    if total is None:
+        if done % PROGRESS_INTERVAL == 0:
+            logger.info(f"{stage} {done} files")
+    elif done % PROGRESS_INTERVAL == 0 or done == total:
+        logger.info(f"{stage} {done}/{total} files")
+
+@lru_cache(maxsize=None)
+def _resolve(path: str) -> str:
+    """os.path.realpath, cached for the duration of a run."""
+    return os.path.realpath(path)
+
+def _import_psd_tools():
+    """Import psd_tools.PSDImage into the module namespace if not done yet."""
+    global PSDImage
+    if PSDImage is None:
+        from psd_tools import PSDImage as psd_image
+        PSDImage = psd_image
+
+def _worker_init():
+    """Pool initializer: import psd_tools once per worker instead of per task."""
+    _import_psd_tools()
+    # Spawned workers don't inherit the parent's zipfile setup
+    _use_isal_deflate()
 
-def extract_layers_from_psd(psd_path: Path, layer_dir: Path) -> int:
+def _use_isal_deflate():
+    """
+    Make zipfile deflate with ISA-L, if installed.
+    
+    This replaces zipfile's zlib for the whole process, and ISA-L only accepts
+    compression levels 0-3, so it is only done when running as the tool
+    (main and pool workers), never on import.
+    """
+    if isal_zlib is not None:
+        zipfile.zlib = isal_zlib
+
+def _write_json_object(f, mapping: Dict):
+    """Write a dict to a text file as a JSON object, one entry at a time."""
+    f.write('{')
+    first = True
+    for key, value in mapping.items():
+        if not first:
+            f.write(',')
+        f.write(json.dumps(key) + ':' + json.dumps(value))
+        first = False
+    f.write('}')
+
+def _journal_path(state_file: Path) -> Path:
+    """Path of the append-only journal that accompanies a state file."""
+    return state_file.with_name(state_file.name + ".journal")
+
+def _in_pool_worker() -> bool:
+    """Whether this is a multiprocessing child (pool worker) rather than the main process."""
+    return multiprocessing.parent_process() is not None
+
+def _hash_algorithm_available(algorithm: Optional[str]) -> bool:
+    """Whether algorithm is one of HASH_ALGORITHMS and usable in this environment."""
+    if algorithm == "blake3":
+        return blake3 is not None
+    return algorithm in HASH_ALGORITHMS
+
+def _new_hasher(algorithm: str = HASH_ALGORITHM):
+    """Create a hash object for the given algorithm (one of HASH_ALGORITHMS)."""
+    if algorithm == "blake3":
+        # Pool workers already run one per core; multithreading each of them
+        # would start cores² hashing threads. The sequential path has the
+        # machine to itself
+        if _in_pool_worker():
+            return blake3.blake3()
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    # The hash only identifies content, so skip FIPS restrictions where supported
+    return hashlib.new("sha256", usedforsecurity=False)
+
+def _check_sha256_backend():
+    """
+    Warn when SHA256 will not run on an accelerated OpenSSL implementation.
+    
+    OpenSSL 1.1.1+ uses the x86 SHA extensions (SHA-NI) or ARMv8 crypto
+    instructions when the CPU has them; Python's builtin fallback does not.
+    """
+    if type(hashlib.new("sha256")).__module__ != "_hashlib":
+        logger.warning("hashlib is not using OpenSSL for SHA256; hashing will be slow. "
+                       "Consider --hasher blake3")
+    elif ssl.OPENSSL_VERSION_INFO < (1, 1, 1):
+        logger.warning(f"{ssl.OPENSSL_VERSION} predates SHA-NI support; hashing will be slow. "
+                       "Consider --hasher blake3")
+
+def _hash_file(file_path: Path, algorithm: str = HASH_ALGORITHM) -> str:
+    """
+    Calculate the content hash of a file.
+    
+    Shared by PSDProcessor and the pool workers so both hash the same way.
+    
+    Args:
+        file_path: Path to the file
+        algorithm: Hash algorithm (one of HASH_ALGORITHMS)
+        
+    Returns:
+        Hexadecimal hash string
+    """
+    file_size = file_path.stat().st_size
+    # A mapped file that is truncated while being hashed (e.g. a PSD still
+    # being saved) raises SIGBUS. In a pool worker that kills the process and
+    # leaves the pool waiting forever for its result, so workers always read
+    use_mmap = file_size > HASH_BLOCK_SIZE and not _in_pool_worker()
+    if algorithm == "blake3" and use_mmap:
+        # Main process only (e.g. sequential runs): BLAKE3 hashes the mapped
+        # file across all cores. Pool workers never get here; they read the
+        # file and hash single-threaded
+        hasher = _new_hasher(algorithm)
+        hasher.update_mmap(file_path)
+        return hasher.hexdigest()
+    
+    with open(file_path, "rb") as f:
+        if use_mmap and file_size <= MMAP_MAX_SIZE:
+            # Hash straight from the page cache; one update call also
+            # releases the GIL for the whole file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                hasher = _new_hasher(algorithm)
+                hasher.update(mm)
+                return hasher.hexdigest()
+    
+        # file_digest (Python 3.11+) runs the whole read/update loop in C
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, partial(_new_hasher, algorithm)).hexdigest()
+    
+        # Older Pythons: read large chunks into one reused buffer
+        file_hash = _new_hasher(algorithm)
+        buffer = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            file_hash.update(view[:n])
+        return file_hash.hexdigest()
+
+def _fast_copy(src: Path, dst: Path):
+    """
+    Copy a file with metadata, like shutil.copy2, keeping the data in the kernel.
+    
+    Uses clonefile on macOS (APFS clones) and os.copy_file_range where
+    available (Linux), which can also reflink on filesystems that support it;
+    falls back to shutil.copyfile otherwise, e.g. across filesystems (EXDEV).
+    """
+    copied = False
+    if _clonefile is not None:
+        # clonefile refuses to overwrite
+        try:
+            os.unlink(dst)
+        except FileNotFoundError:
+            pass
+        copied = _clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+    if not copied and hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                remaining = os.fstat(s.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+                    if n == 0:
+                        break
+                    remaining -= n
+            copied = remaining == 0
+        except OSError:
+            copied = False
+    if not copied:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+def _top_level_mtime(root: str, exclude: Optional[str] = None) -> int:
+    """
+    Latest st_mtime_ns of root and its immediate subdirectories.
+    
+    A directory's mtime changes when entries are added, removed or renamed in
+    it, so this detects such changes in the top two levels of the tree with one
+    scandir and a stat per subdirectory. Changes further down still need
+    --refresh-list.
+    
+    Args:
+        root: Directory to check
+        exclude: Subdirectory path to leave out (the output directory)
+    """
+    latest = os.stat(root).st_mtime_ns
+    with os.scandir(root) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False) and entry.path != exclude:
+                    latest = max(latest, entry.stat(follow_symlinks=False).st_mtime_ns)
+            except OSError:
+                pass
+    return latest
+
+def _list_psd_dir(path: str) -> Tuple[List[str], List[str]]:
+    """
+    List one directory for the PSD scan.
+    
+    Uses os.scandir so file/dir checks come from the cached directory entry
+    instead of a stat per file. Both lists are sorted, since readdir order
+    depends on the filesystem and would otherwise change output naming.
+    
+    Returns:
+        (PSD file paths, subdirectory paths), as str
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith('.psd') and entry.is_file():
+                        files.append(entry.path)
+                except OSError as e:
+                    # e.g. a dangling entry on a network share; keep listing the rest
+                    logger.debug(f"Skipping unreadable entry {entry.path}: {e}")
+    except OSError as e:
+        logger.debug(f"Skipping unreadable directory {path}: {e}")
+    files.sort()
+    subdirs.sort()
+    return files, subdirs
+
+def _scan_psd_files(root: Path) -> Iterator[str]:
+    """
+    Recursively yield paths (as str) of PSD files below root.
+    
+    Each directory's files come before its subdirectories, in sorted order.
+    Symlinked directories are not followed and unreadable directories or
+    entries are skipped, matching os.walk's defaults.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        files, subdirs = _list_psd_dir(stack.pop())
+        yield from files
+        # Reverse so subdirectories are visited in order
+        stack.extend(reversed(subdirs))
+
+def _iter_psd_batches(root: Path, max_workers: int = SCAN_THREADS) -> Iterator[List[str]]:
+    """
+    Yield the PSD files below root in batches, in _scan_psd_files order.
+    
+    The first batch holds the files directly in root, then one batch per
+    top-level subdirectory as soon as it (and all before it) are scanned.
+    """
+    files, subdirs = _list_psd_dir(os.fspath(root))
+    yield files
+    
+    if len(subdirs) < 2 or max_workers <= 1:
+        for subdir in subdirs:
+            yield list(_scan_psd_files(subdir))
+        return
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(subdirs))) as executor:
+        yield from executor.map(lambda d: list(_scan_psd_files(d)), subdirs)
+
+def extract_layers_from_psd(psd_path: Path, layer_dir: Path, max_workers: int = LAYER_THREADS, layer_format: str = DEFAULT_LAYER_FORMAT, zipf: Optional[zipfile.ZipFile] = None, zip_lock=None) -> int:
     """
     Standalone function to extract layers (for multiprocessing).
+    
+    Layers are collected first, then rendered and saved by a thread pool.
+    
+    Args:
+        psd_path: PSD file to extract
+        layer_dir: Directory to save layer images to (ignored when zipf is given)
+        max_workers: Threads used to render and encode layers
+        layer_format: Image format for extracted layers (key of LAYER_FORMATS)
+        zipf: Archive to write layer images into directly instead of layer_dir
+        zip_lock: Lock serializing writes to zipf; pass the one other writers to zipf use
+        
+    Returns:
+        Number of layers saved
     """
     try:
+        _import_psd_tools()
         psd = PSDImage.open(psd_path)
-        layer_count = 0
         
-        # Create layer directory
-        layer_dir.mkdir(parents=True, exist_ok=True)
+        extension, image_format, save_options = LAYER_FORMATS[layer_format]
+        if zipf is None:
+            # Create layer directory
+            layer_dir.mkdir(parents=True, exist_ok=True)
+            root = os.fspath(layer_dir)
+        else:
+            # Paths become archive names; nothing touches the filesystem
+            root = ""
         
-        # Extract layers recursively
+        # Collect layers recursively; this only walks the tree, no rendering
         name_counter = {}
+        jobs = []
         for layer in psd:
-            layer_count += _extract_layers_recursive_worker(layer, layer_dir, name_counter)
+            _extract_layers_recursive_worker(layer, root, name_counter, jobs, extension, make_dirs=zipf is None)
+        
+        if zipf is None:
+            # Render and save layers in parallel
+            save = partial(_save_layer_worker, image_format=image_format, save_options=save_options)
+        else:
+            # Render and encode in parallel; only the archive writes are serialized,
+            # since ZipFile is not thread-safe
+            lock = zip_lock if zip_lock is not None else threading.Lock()
+            encode = partial(_encode_layer_worker, image_format=image_format, save_options=save_options)
+            
+            def save(layer, arcname):
+                buffer = _thread_buffer()
+                if not encode(layer, buffer):
+                    return False
+                # Hand the buffer's memory to the archive without a bytes copy
+                with lock, buffer.getbuffer() as data:
+                    _zip_write_image(zipf, arcname, data)
+                return True
+        
+        if max_workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+                futures = [executor.submit(save, layer, path) for layer, path in jobs]
+                layer_count = sum(f.result() for f in futures)
+        else:
+            layer_count = sum(save(layer, path) for layer, path in jobs)
         
         # Also save composite image
         try:
             composite = psd.topil()
             if composite:
-                composite_path = layer_dir / "composite.png"
-                composite.save(composite_path, 'PNG')
+                if zipf is None:
+                    composite_path = layer_dir / f"composite{extension}"
+                    composite.save(composite_path, image_format, **save_options)
+                else:
+                    buffer = _thread_buffer()
+                    composite.save(buffer, image_format, **save_options)
+                    with lock, buffer.getbuffer() as data:
+                        _zip_write_image(zipf, f"composite{extension}", data)
                 # logger.debug("Saved composite image") 
         except Exception as e:
             print(f"Warning: Failed to save composite image for {psd_path}: {e}")
@@ -484,159 +1260,229 @@ def extract_layers_from_psd(psd_path: Path, layer_dir: Path) -> int:
         print(f"Error: Failed to extract layers from {psd_path}: {e}")
         return 0
 
+def _thread_buffer() -> io.BytesIO:
+    """Return this thread's reusable encode buffer, emptied."""
+    buffer = getattr(_encode_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _encode_buffers.buffer = io.BytesIO()
+    else:
+        buffer.seek(0)
+        buffer.truncate()
+    return buffer
+
+def _zip_add_file(zipf: zipfile.ZipFile, path: Path, arcname: str, compress_type: int):
+    """Like ZipFile.write, but copies in HASH_BLOCK_SIZE chunks instead of 8 KiB ones."""
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    zinfo.compress_type = compress_type
+    # As ZipFile.write does; the attribute is only public (compress_level) from 3.13
+    zinfo._compresslevel = zipf.compresslevel
+    with open(path, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+        shutil.copyfileobj(src, dst, HASH_BLOCK_SIZE)
+
+def _zip_write_image(zipf: zipfile.ZipFile, arcname: str, data):
+    """Add an encoded image to an archive, storing already-compressed formats as-is."""
+    if arcname.lower().endswith(ZIP_STORED_SUFFIXES):
+        zipf.writestr(arcname, data, compress_type=zipfile.ZIP_STORED)
+    else:
+        zipf.writestr(arcname, data)
+
+@lru_cache(maxsize=8192)
 def _sanitize_filename_worker(name: str) -> str:
-    """Worker version of sanitize_filename."""
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        name = name.replace(char, '_')
-    return name.strip()
+    """
+    Replace characters that are invalid in filenames with underscores.
+    
+    Cached: layer names repeat heavily within and across PSDs ("Layer 1", ...).
+    """
+    # Strip first so surrounding whitespace (tabs, newlines) is removed rather
+    # than turned into underscores
+    return name.strip().translate(_SANITIZE_TRANS)
 
-def _extract_layers_recursive_worker(layer, output_dir: Path, counter: Dict[str, int]) -> int:
-    """Worker version of recursive extraction."""
-    count = 0
+def _extract_layers_recursive_worker(layer, output_dir: Union[str, Path], counter: Dict[str, int], jobs: List[Tuple], extension: str = ".png", make_dirs: bool = True) -> None:
+    """
+    Worker version of recursive extraction; appends (layer, layer_path) jobs.
     
+    Paths are plain strings; without make_dirs they are archive names, which
+    always use '/' as separator.
+    """
+    join = os.path.join if make_dirs else posixpath.join
     # Handle groups/folders
     if layer.is_group():
         group_name = _sanitize_filename_worker(layer.name)
-        group_dir = output_dir / group_name
-        group_dir.mkdir(parents=True, exist_ok=True)
+        group_dir = join(output_dir, group_name)
+        if make_dirs:
+            os.makedirs(group_dir, exist_ok=True)
         
         for child in layer:
-            count += _extract_layers_recursive_worker(child, group_dir, counter)
-        return count
+            _extract_layers_recursive_worker(child, group_dir, counter, jobs, extension, make_dirs)
+        return
         
-    # Handle normal layers
-    if hasattr(layer, 'topil') and layer.visible:
-        try:
-            layer_image = layer.topil()
-            if layer_image:
-                base_name = _sanitize_filename_worker(layer.name)
-                if not base_name:
-                    base_name = "unnamed_layer"
-                    
-                if base_name not in counter:
-                    counter[base_name] = 0
-                else:
-                    counter[base_name] += 1
-                    
-                if counter[base_name] == 0:
-                    layer_filename = f"{base_name}.png"
-                else:
-                    layer_filename = f"{base_name}_{counter[base_name]}.png"
-                    
-                layer_path = output_dir / layer_filename
-                layer_image.save(layer_path, 'PNG')
-                count += 1
-        except Exception as e:
-            pass # Squelch individual layer errors in worker to avoid log spam
+    # Handle normal layers; hidden or empty layers are skipped before the
+    # expensive topil() call
+    try:
+        wanted = hasattr(layer, 'topil') and layer.visible and layer.width > 0 and layer.height > 0
+    except Exception:
+        # e.g. a malformed layer without a bbox; skip it like a layer that
+        # fails to render rather than losing the rest of the file
+        wanted = False
+    if wanted:
+        base_name = _sanitize_filename_worker(layer.name)
+        if not base_name:
+            base_name = "unnamed_layer"
+            
+        if base_name not in counter:
+            counter[base_name] = 0
+        else:
+            counter[base_name] += 1
+            
+        if counter[base_name] == 0:
+            layer_filename = f"{base_name}{extension}"
+        else:
+            layer_filename = f"{base_name}_{counter[base_name]}{extension}"
             
-    return count
+        jobs.append((layer, join(output_dir, layer_filename)))
 
-def process_file_worker(
-    psd_path: Path, 
-    input_dir: Path, 
-    output_dir: Path, 
-    no_copy: bool,
-    shared_hashes: Dict, 
-    shared_counters: Dict, 
-    shared_processed: Dict,
-    lock
-) -> bool:
+def _save_layer_worker(layer, layer_path: Union[str, Path], image_format: str = 'PNG', save_options: Optional[Dict] = None) -> bool:
+    """Render a single layer and save it in the given format. Returns True if saved."""
+    try:
+        layer_image = layer.topil()
+        if layer_image:
+            layer_image.save(layer_path, image_format, **(save_options or {}))
+            return True
+    except Exception as e:
+        pass # Squelch individual layer errors in worker to avoid log spam
+    return False
+
+def _encode_layer_worker(layer, buffer: io.BytesIO, image_format: str = 'PNG', save_options: Optional[Dict] = None) -> bool:
+    """Render a single layer and encode it into buffer. Returns True if encoded."""
+    try:
+        layer_image = layer.topil()
+        if layer_image:
+            layer_image.save(buffer, image_format, **(save_options or {}))
+            return True
+    except Exception:
+        pass # Squelch individual layer errors in worker to avoid log spam
+    return False
+
+def _worker_task(func, psd_path: Path) -> Tuple[Path, Optional[Tuple[str, str]]]:
+    """Run a worker and pair its result with the input path for unordered collection."""
+    return psd_path, func(psd_path)
+
+def _export_task(func, job: Tuple[Path, str]) -> Tuple[Tuple[Path, str], bool]:
+    """Run an export worker on a (psd_path, output_name) job, paired with the job."""
+    return job, func(*job)
+
+def hash_file_worker(psd_path: Path, hash_algorithm: str = HASH_ALGORITHM) -> Optional[str]:
     """
-    Worker function to process a single PSD file.
+    Worker function for the hashing stage.
+    
+    Returns:
+        Content hash of the file, None on failure
     """
     try:
-        # Calculate hash
-        sha256_hash = hashlib.sha256()
-        with open(psd_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        file_hash = sha256_hash.hexdigest()
-        
-        output_name = ""
-        should_process = False
-        
-        # Critical section for checking/updating state
-        with lock:
-            if file_hash in shared_hashes:
-                # Duplicate
-                output_name = shared_hashes[file_hash]
-                # print(f"Duplicate: {psd_path.name} -> {output_name}")
-            else:
-                # New file
-                should_process = True
-                
-                # Determine name
-                original_name = psd_path.name
-                name_without_ext = Path(original_name).stem
-                
-                if name_without_ext not in shared_counters:
-                    shared_counters[name_without_ext] = -1
-                
-                while True:
-                    shared_counters[name_without_ext] += 1
-                    counter = shared_counters[name_without_ext]
-                    
-                    if counter == 0:
-                        temp_name = f"{name_without_ext}.psd"
-                    else:
-                        temp_name = f"{name_without_ext}-{counter}.psd"
-                    
-                    # Check if name is taken by another hash (unlikely but possible in race)
-                    # or exists on disk (checked by main, but good to be safe)
-                    # In this locked context, we trust shared_counters + shared_hashes
-                    output_name = temp_name
-                    break
-                
-                shared_hashes[file_hash] = output_name
-        
-        # Perform IO operations outside lock
-        # output_path = output_dir / output_name # No longer needed as we copy to layer_dir
+        return _hash_file(psd_path, hash_algorithm)
+    except Exception as e:
+        print(f"Failed to hash {psd_path}: {e}")
+        return None
+
+def export_file_worker(
+    psd_path: Path,
+    output_name: str,
+    output_dir: Path,
+    no_copy: bool,
+    layer_format: str = DEFAULT_LAYER_FORMAT,
+    no_zip: bool = False,
+    layer_threads: int = LAYER_THREADS,
+    store_psd: bool = False
+) -> bool:
+    """
+    Worker function for the export stage: copy and extract one PSD.
+    
+    Layers and the PSD copy are written straight into <name>_layers.zip, or
+    into a <name>_layers directory with no_zip.
+    
+    Args:
+        psd_path: Source PSD file
+        output_name: Output name assigned to its content
+        output_dir: Output directory
+        no_copy: Skip copying the PSD
+        layer_format: Image format for extracted layers (key of LAYER_FORMATS)
+        no_zip: Leave the layers in a directory instead of an archive
+        layer_threads: Threads used to render and encode layers
+        store_psd: Add the PSD copy to the archive uncompressed
         
-        if should_process:
-            # Extract layers
-            layer_dir_name = Path(output_name).stem + "_layers"
+    Returns:
+        True on success, False on failure
+    """
+    layer_dir_name = os.path.splitext(output_name)[0] + "_layers"
+    if no_zip:
+        try:
             layer_dir = output_dir / layer_dir_name
             
             # Create layer directory first
             layer_dir.mkdir(parents=True, exist_ok=True)
 
-            if not no_copy:
-                # Copy PSD to layer directory
-                shutil.copy2(psd_path, layer_dir / output_name)
+            # Copy the PSD on a background thread so disk I/O overlaps with
+            # parsing and rendering the layers
+            with ThreadPoolExecutor(max_workers=1) as copier:
+                copy_future = None
+                if not no_copy:
+                    copy_future = copier.submit(_fast_copy, psd_path, layer_dir / output_name)
+                
+                extract_layers_from_psd(psd_path, layer_dir, layer_threads, layer_format)
+                
+                if copy_future is not None:
+                    copy_future.result()
+            return True
             
-            extract_layers_from_psd(psd_path, layer_dir)
+        except Exception as e:
+            print(f"Failed to process {psd_path}: {e}")
+            return False
+    
+    # Written under a temporary name and renamed when complete, so a crash
+    # never leaves a truncated archive under the final name
+    zip_path = output_dir / f"{layer_dir_name}.zip"
+    tmp_path = output_dir / f"{layer_dir_name}.zip.tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESS_LEVEL) as zipf:
+            zip_lock = threading.Lock()
             
-            # Zip the layer directory
-            zip_path = output_dir / f"{layer_dir_name}.zip"
-            try:
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for root, dirs, files in os.walk(layer_dir):
-                        for file in files:
-                            file_path = Path(root) / file
-                            arcname = file_path.relative_to(layer_dir)
-                            zipf.write(file_path, arcname)
+            def add_psd():
+                with zip_lock:
+                    _zip_add_file(zipf, psd_path, output_name,
+                                  zipfile.ZIP_STORED if store_psd else zipfile.ZIP_DEFLATED)
+            
+            # Add the PSD on a background thread so it overlaps with parsing
+            # and rendering the layers
+            with ThreadPoolExecutor(max_workers=1) as copier:
+                copy_future = None
+                if not no_copy:
+                    copy_future = copier.submit(add_psd)
                 
-                # Remove the layer directory after successful zipping
-                shutil.rmtree(layer_dir)
+                extract_layers_from_psd(psd_path, None, layer_threads, layer_format, zipf=zipf, zip_lock=zip_lock)
                 
-            except Exception as e:
-                print(f"Failed to zip or cleanup {layer_dir}: {e}")
-                # Attempt to cleanup partial zip if it exists
-                if zip_path.exists():
-                    try:
-                        zip_path.unlink()
-                    except:
-                        pass
-            
+                if copy_future is not None:
+                    copy_future.result()
+        os.replace(tmp_path, zip_path)
         return True
         
     except Exception as e:
         print(f"Failed to process {psd_path}: {e}")
+        # Don't leave a partial archive behind
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
         return False
-    
-
 
+def _handle_sigterm(signum, frame):
+    """Exit via SystemExit on SIGTERM so finally blocks and atexit handlers run."""
+    if _in_pool_worker():
+        # Pool workers inherit this handler; Pool.terminate() expects them to die
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+        return
+    logger.warning("Terminated; saving progress before exiting")
+    sys.exit(128 + signum)
 
 def main():
     """Main entry point for the application."""
@@ -684,6 +1530,19 @@ Examples:
         help='Skip copying the source PSD file to the output directory'
     )
     
+    parser.add_argument(
+        '--no-zip',
+        action='store_true',
+        help='Leave extracted layers in <name>_layers directories instead of zip archives'
+    )
+    
+    parser.add_argument(
+        '--store-psd',
+        action='store_true',
+        help='Add the PSD copy to the layer archive without compression; faster, '
+             'but archives of PSDs with uncompressed image data get larger'
+    )
+    
     parser.add_argument(
         '--refresh-list',
         action='store_true',
@@ -696,6 +1555,40 @@ Examples:
         help='Scan and update the file list, then exit without processing files'
     )
     
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='Merge the state journal into the state file, then exit without processing files'
+    )
+    
+    parser.add_argument(
+        '--layer-format',
+        choices=sorted(LAYER_FORMATS),
+        default=DEFAULT_LAYER_FORMAT,
+        help='Image format for extracted layers: png (default zlib level), '
+             'png-fast (zlib level 1), webp (lossless, fastest method), '
+             'webp-lossy (quality 90, fastest method) '
+             f'(default: {DEFAULT_LAYER_FORMAT})'
+    )
+    
+    parser.add_argument(
+        '--force-hash',
+        action='store_true',
+        help='Rehash every file instead of skipping files whose size and '
+             'modification time match the state file'
+    )
+    
+    parser.add_argument(
+        '--hasher',
+        choices=('auto',) + HASH_ALGORITHMS,
+        default='auto',
+        help='Content hash used for deduplication; auto keeps the algorithm '
+             'recorded in an existing state file (sha256 for state files that '
+             'predate this option) and for new state picks blake3 when the blake3 '
+             'package is installed, sha256 otherwise. Choosing an algorithm that '
+             'differs from the state file\'s discards its recorded hashes (default: auto)'
+    )
+    
     args = parser.parse_args()
     
     # Set log level
@@ -712,15 +1605,38 @@ Examples:
         logger.error(f"Input path is not a directory: {args.input_dir}")
         sys.exit(1)
     
+    if args.hasher == "blake3" and blake3 is None:
+        logger.error("blake3 library not found. Please install it with: pip install blake3")
+        sys.exit(1)
+    
     # Reset state if requested
     if args.reset:
         state_file = Path(args.state_file)
+        journal_file = _journal_path(state_file)
+        if journal_file.exists():
+            journal_file.unlink()
         if state_file.exists():
             state_file.unlink()
             logger.info("State file reset")
     
     # Create processor and run
-    processor = PSDProcessor(args.input_dir, args.output_dir, args.state_file, args.no_copy, args.refresh_list, args.update_list_only)
+    processor = PSDProcessor(args.input_dir, args.output_dir, args.state_file, args.no_copy, args.refresh_list, args.update_list_only, args.layer_format, args.hasher, args.force_hash, args.no_zip, args.store_psd)
+    if processor.hash_algorithm == "sha256":
+        _check_sha256_backend()
+    if args.compact:
+        processor.compact_state()
+        return
+    
+    # Workers import psd_tools themselves; only check that it is installed, as
+    # a failing pool initializer would make the pool respawn workers forever
+    if not args.update_list_only and importlib.util.find_spec("psd_tools") is None:
+        print("Error: psd-tools library not found. Please install it with: pip install psd-tools")
+        sys.exit(1)
+    
+    # Turn SIGTERM into a normal exit so pending state is flushed on the way out
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    
+    _use_isal_deflate()
     processor.process_all()
 
 
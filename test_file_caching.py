@@ -4,14 +4,22 @@ import sys
 import os
 from pathlib import Path
 import tempfile
-import shutil
 
-# Mock psd_tools before importing the module
-sys.modules['psd_tools'] = MagicMock()
+# Mock psd_tools before importing the module; setdefault keeps one shared
+# mock when both test modules are loaded in the same process
+sys.modules.setdefault('psd_tools', MagicMock())
 
 # Import the module under test
 sys.path.append(r'j:\Home\Projects\Development\Sources\photoshop')
 import psd_processor
+from testutils import fast_rmtree, fast_touch
+
+def _read_file_list(path):
+    """Paths stored in an allFiles.txt, without its mtime header line."""
+    lines = Path(path).read_text(encoding='utf-8').splitlines()
+    if lines and lines[0].startswith(psd_processor.FILE_LIST_MTIME_HEADER):
+        del lines[0]
+    return lines
 
 class TestFileCaching(unittest.TestCase):
     def setUp(self):
@@ -22,20 +30,21 @@ class TestFileCaching(unittest.TestCase):
         self.output_dir.mkdir()
         
         # Create some dummy PSD files
-        (self.input_dir / "file1.psd").touch()
-        (self.input_dir / "file2.psd").touch()
+        fast_touch(self.input_dir / "file1.psd")
+        fast_touch(self.input_dir / "file2.psd")
         (self.input_dir / "subdir").mkdir()
-        (self.input_dir / "subdir" / "file3.psd").touch()
+        fast_touch(self.input_dir / "subdir" / "file3.psd")
 
     def tearDown(self):
-        shutil.rmtree(self.test_dir)
+        fast_rmtree(self.test_dir)
 
     def test_cache_creation(self):
         """Test that allFiles.txt is created after scanning."""
         processor = psd_processor.PSDProcessor(
             str(self.input_dir), 
             str(self.output_dir), 
-            refresh_list=False
+            refresh_list=False,
+            min_cache_size=0
         )
         
         files = processor._find_psd_files()
@@ -44,9 +53,27 @@ class TestFileCaching(unittest.TestCase):
         self.assertTrue((self.output_dir / "allFiles.txt").exists())
         
         # Verify content
-        with open(self.output_dir / "allFiles.txt", 'r') as f:
-            lines = f.readlines()
-            self.assertEqual(len(lines), 3)
+        lines = _read_file_list(self.output_dir / "allFiles.txt")
+        self.assertEqual(len(lines), 3)
+
+    def test_cache_is_sorted(self):
+        """Test that scanned paths are stored in a deterministic order."""
+        for name in ("zeta.psd", "alpha.psd", "mid.psd"):
+            fast_touch(self.input_dir / "subdir" / name)
+            
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir), 
+            str(self.output_dir), 
+            refresh_list=True,
+            min_cache_size=0
+        )
+        files = processor._find_psd_files()
+        
+        # Files of a directory in name order, before its subdirectories
+        self.assertEqual([p.relative_to(self.input_dir).as_posix() for p in files],
+                         ["file1.psd", "file2.psd", "subdir/alpha.psd", "subdir/file3.psd",
+                          "subdir/mid.psd", "subdir/zeta.psd"])
+        self.assertEqual(_read_file_list(self.output_dir / "allFiles.txt"), [str(p) for p in files])
 
     def test_read_from_cache(self):
         """Test that files are read from cache if it exists."""
@@ -88,9 +115,8 @@ class TestFileCaching(unittest.TestCase):
         self.assertNotIn(fake_path, files)
         
         # Cache should be updated
-        with open(cache_file, 'r') as f:
-            lines = f.readlines()
-            self.assertEqual(len(lines), 3)
+        lines = _read_file_list(cache_file)
+        self.assertEqual(len(lines), 3)
 
     def test_update_list_only(self):
         """Test that --update-list-only updates the list and exits without processing."""
@@ -115,10 +141,9 @@ class TestFileCaching(unittest.TestCase):
         processor.process_all()
         
         # Check that cache was updated (should have 3 files, not 1 fake)
-        with open(cache_file, 'r') as f:
-            lines = f.readlines()
-            self.assertEqual(len(lines), 3)
-            self.assertNotIn(str(fake_path) + "\n", lines)
+        lines = _read_file_list(cache_file)
+        self.assertEqual(len(lines), 3)
+        self.assertNotIn(str(fake_path), lines)
             
         # Check that NO processing happened (output dir should only have allFiles.txt)
         # Note: psd_state.json might be created if _load_state is called, but no PSDs should be copied/processed.
@@ -128,5 +153,103 @@ class TestFileCaching(unittest.TestCase):
         processed_files = [f for f in output_files if f.name not in ["allFiles.txt", "psd_state.json"]]
         self.assertEqual(len(processed_files), 0, f"Found unexpected processed files: {processed_files}")
 
+    def test_scan_filters_entries(self):
+        """Test that the scan matches .psd case-insensitively and skips dirs named *.psd and symlinked dirs."""
+        fast_touch(self.input_dir / "upper.PSD")
+        fast_touch(self.input_dir / "notes.txt")
+        (self.input_dir / "folder.psd").mkdir()
+        fast_touch(self.input_dir / "folder.psd" / "inner.psd")
+        try:
+            (self.input_dir / "loop").symlink_to(self.input_dir, target_is_directory=True)
+        except OSError:
+            pass
+            
+        found = sorted(os.path.relpath(p, self.input_dir) for p in psd_processor._scan_psd_files(self.input_dir))
+        expected = sorted(["file1.psd", "file2.psd", "upper.PSD",
+                           os.path.join("subdir", "file3.psd"), os.path.join("folder.psd", "inner.psd")])
+        self.assertEqual(found, expected)
+
+    def test_parallel_scan_matches_serial_order(self):
+        """Test that the threaded scan returns files in the same order as a serial walk."""
+        for name in ("b_dir", "a_dir", "c_dir"):
+            (self.input_dir / name / "nested").mkdir(parents=True)
+            fast_touch(self.input_dir / name / "x.psd")
+            fast_touch(self.input_dir / name / "nested" / "y.PSD")
+            
+        serial = list(psd_processor._scan_psd_files(self.input_dir))
+        parallel = [p for batch in psd_processor._iter_psd_batches(self.input_dir, max_workers=4) for p in batch]
+        
+        self.assertEqual(len(serial), 9)
+        self.assertEqual(parallel, serial)
+
+    def test_small_scan_is_not_cached(self):
+        """Test that a scan below min_cache_size creates no list but updates an existing one."""
+        cache_file = self.output_dir / "allFiles.txt"
+        processor = psd_processor.PSDProcessor(str(self.input_dir), str(self.output_dir), refresh_list=True)
+        self.assertEqual(len(processor._find_psd_files()), 3)
+        self.assertFalse(cache_file.exists())
+        
+        # e.g. a list written earlier with --update-list-only
+        cache_file.write_text(str(self.input_dir / "fake.psd") + "\n", encoding='utf-8')
+        files = processor._find_psd_files()
+        self.assertEqual(_read_file_list(cache_file), [str(p) for p in files])
+
+    def test_cache_invalidates_on_new_file(self):
+        """Test that a cached list is rescanned once a top-level directory changes."""
+        cache_file = self.output_dir / "allFiles.txt"
+        processor = psd_processor.PSDProcessor(str(self.input_dir), str(self.output_dir), min_cache_size=0)
+        self.assertEqual(len(processor._find_psd_files()), 3)
+        header = cache_file.read_text(encoding='utf-8').splitlines()[0]
+        stamp = int(header[len(psd_processor.FILE_LIST_MTIME_HEADER):])
+        
+        # Unchanged tree: the list is reused without walking it
+        with patch('psd_processor._iter_psd_batches') as mock_scan:
+            self.assertEqual(len(processor._find_psd_files()), 3)
+            mock_scan.assert_not_called()
+        
+        # Set the mtime explicitly, as coarse timestamps may not advance within the test
+        fast_touch(self.input_dir / "subdir" / "new.psd")
+        os.utime(self.input_dir / "subdir", ns=(stamp + 10**9, stamp + 10**9))
+        files = processor._find_psd_files()
+        self.assertIn(self.input_dir / "subdir" / "new.psd", files)
+        self.assertEqual(len(_read_file_list(cache_file)), 4)
+
+    def test_cache_ignores_output_dir_inside_input(self):
+        """Test that writes to an output directory inside the input directory keep the cache valid."""
+        output_dir = self.input_dir / "output"
+        output_dir.mkdir()
+        processor = psd_processor.PSDProcessor(str(self.input_dir), str(output_dir), min_cache_size=0)
+        self.assertEqual(len(processor._find_psd_files()), 3)
+        stamp = int((output_dir / "allFiles.txt").read_text(encoding='utf-8').splitlines()[0]
+                    [len(psd_processor.FILE_LIST_MTIME_HEADER):])
+        
+        # As if the run had written its archives
+        fast_touch(output_dir / "file1_layers.zip")
+        os.utime(output_dir, ns=(stamp + 10**9, stamp + 10**9))
+        with patch('psd_processor._iter_psd_batches') as mock_scan:
+            self.assertEqual(len(processor._find_psd_files()), 3)
+            mock_scan.assert_not_called()
+
+    def test_find_psd_paths_reports_batches(self):
+        """Test that scanned paths are handed over in order as each subtree finishes."""
+        for name in ("b_dir", "a_dir"):
+            (self.input_dir / name).mkdir()
+            fast_touch(self.input_dir / name / "x.psd")
+            
+        processor = psd_processor.PSDProcessor(str(self.input_dir), str(self.output_dir), refresh_list=True, min_cache_size=0)
+        batches = []
+        files = processor._find_psd_paths(on_batch=batches.append)
+        
+        # Root files first, then one batch per top-level subdirectory
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(len(batches[0]), 2)
+        self.assertEqual([path for batch in batches for path in batch], files)
+        
+        # A cached list arrives as a single batch
+        processor.refresh_list = False
+        batches.clear()
+        self.assertEqual(processor._find_psd_paths(on_batch=batches.append), files)
+        self.assertEqual(batches, [files])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,19 +1,35 @@
 import unittest
-from unittest.mock import MagicMock, patch, mock_open
+from unittest.mock import MagicMock, PropertyMock, patch, mock_open
 import sys
 import os
 from pathlib import Path
 import tempfile
 import shutil
 import zipfile
+import json
+import hashlib
+import signal
 
-# Mock psd_tools before importing the module
-sys.modules['psd_tools'] = MagicMock()
+# Mock psd_tools before importing the module; setdefault keeps one shared
+# mock when both test modules are loaded in the same process
+sys.modules.setdefault('psd_tools', MagicMock())
 
 # Import the module under test
 # We need to add the directory to sys.path
 sys.path.append(r'j:\Home\Projects\Development\Sources\photoshop')
 import psd_processor
+from testutils import fast_rmtree, fast_touch
+
+class _InlinePool:
+    """Stand-in for multiprocessing.Pool that runs tasks in the calling process."""
+    def __init__(self, processes=None, initializer=None):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def imap_unordered(self, func, iterable, chunksize=1):
+        return map(func, iterable)
 
 class TestPSDProcessor(unittest.TestCase):
     def setUp(self):
@@ -24,12 +40,28 @@ class TestPSDProcessor(unittest.TestCase):
         self.output_dir.mkdir()
 
     def tearDown(self):
-        shutil.rmtree(self.test_dir)
+        fast_rmtree(self.test_dir)
 
     def test_sanitize_filename(self):
         self.assertEqual(psd_processor._sanitize_filename_worker("test<file>name"), "test_file_name")
         self.assertEqual(psd_processor._sanitize_filename_worker("layer/1"), "layer_1")
         self.assertEqual(psd_processor._sanitize_filename_worker("valid_name"), "valid_name")
+        self.assertEqual(psd_processor._sanitize_filename_worker(" tab\there\n"), "tab_here")
+
+    def test_get_output_name(self):
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(Path(self.test_dir) / "state.json")
+        )
+        # An unrelated file already occupies doc-1.psd in the output dir
+        fast_touch(self.output_dir / "doc-1.psd")
+        
+        self.assertEqual(processor._get_output_name("h1", "doc.psd"), "doc.psd")
+        processor.file_hashes["h1"] = "doc.psd"
+        self.assertEqual(processor._get_output_name("h1", "other.psd"), "doc.psd")
+        self.assertEqual(processor._get_output_name("h2", "doc.PSD"), "doc-2.psd")
+        self.assertEqual(processor.name_counters["doc"], 2)
 
     @patch('psd_processor.PSDImage')
     def test_extract_layers_recursive(self, mock_psd_image):
@@ -38,23 +70,40 @@ class TestPSDProcessor(unittest.TestCase):
         mock_layer1.name = "Layer 1"
         mock_layer1.visible = True
         mock_layer1.is_group.return_value = False
+        mock_layer1.width = mock_layer1.height = 10
         mock_layer1.topil.return_value = MagicMock() # Mock image
         
         mock_layer2 = MagicMock()
         mock_layer2.name = "Layer 2"
         mock_layer2.visible = True
         mock_layer2.is_group.return_value = False
+        mock_layer2.width = mock_layer2.height = 10
         mock_layer2.topil.return_value = MagicMock()
         
         mock_layer3 = MagicMock()
         mock_layer3.name = "Layer 3"
         mock_layer3.visible = False
         mock_layer3.is_group.return_value = False
+        mock_layer3.width = mock_layer3.height = 10
+        
+        mock_empty = MagicMock()
+        mock_empty.name = "Empty"
+        mock_empty.visible = True
+        mock_empty.is_group.return_value = False
+        mock_empty.width = 0
+        mock_empty.height = 0
+        
+        # A malformed layer whose bounds can't be read is skipped, not fatal
+        mock_broken = MagicMock()
+        mock_broken.name = "Broken"
+        mock_broken.visible = True
+        mock_broken.is_group.return_value = False
+        type(mock_broken).width = PropertyMock(side_effect=ValueError("no bbox"))
         
         mock_group = MagicMock()
         mock_group.name = "Group 1"
         mock_group.is_group.return_value = True
-        mock_group.__iter__.return_value = [mock_layer2, mock_layer3]
+        mock_group.__iter__.return_value = [mock_broken, mock_layer2, mock_layer3, mock_empty]
         
         mock_psd = MagicMock()
         mock_psd.__iter__.return_value = [mock_layer1, mock_group]
@@ -70,32 +119,97 @@ class TestPSDProcessor(unittest.TestCase):
         self.assertEqual(count, 2) # Layer 1 and Layer 2
         mock_layer1.topil.return_value.save.assert_called()
         mock_layer2.topil.return_value.save.assert_called()
+        mock_broken.topil.assert_not_called()
+        # The default format skips Pillow's slow optimize pass and uses fast zlib
+        save_kwargs = mock_layer1.topil.return_value.save.call_args.kwargs
+        self.assertEqual(save_kwargs.get('compress_level'), 1)
+        self.assertIs(save_kwargs.get('optimize'), False)
+        # Hidden and zero-area layers are never rendered
+        mock_layer3.topil.assert_not_called()
+        mock_empty.topil.assert_not_called()
         self.assertTrue((layer_dir / "Group 1").exists())
 
-    def test_process_file_worker_logic(self):
+    @patch('psd_processor.PSDImage')
+    def test_extract_layers_into_zip(self, mock_psd_image):
+        # Large enough that the archive's CRC pass releases the GIL, so
+        # unserialized writes from layer threads would overlap
+        image_data = b"image data" * 100000
+        
+        def fake_image():
+            image = MagicMock()
+            image.save.side_effect = lambda fp, *args, **kwargs: fp.write(image_data)
+            return image
+        
+        mock_layer = MagicMock()
+        mock_layer.name = "Layer"
+        mock_layer.visible = True
+        mock_layer.is_group.return_value = False
+        mock_layer.width = mock_layer.height = 10
+        mock_layer.topil.return_value = fake_image()
+        
+        mock_child = MagicMock()
+        mock_child.name = "Layer"
+        mock_child.visible = True
+        mock_child.is_group.return_value = False
+        mock_child.width = mock_child.height = 10
+        mock_child.topil.return_value = fake_image()
+        
+        mock_group = MagicMock()
+        mock_group.name = "Group"
+        mock_group.is_group.return_value = True
+        mock_group.__iter__.return_value = [mock_child]
+        
+        # Enough layers that several threads write to the archive at once
+        many_layers = []
+        for i in range(16):
+            layer = MagicMock()
+            layer.name = f"L{i:02d}"
+            layer.visible = True
+            layer.is_group.return_value = False
+            layer.width = layer.height = 10
+            layer.topil.return_value = fake_image()
+            many_layers.append(layer)
+        mock_many = MagicMock()
+        mock_many.name = "Many"
+        mock_many.is_group.return_value = True
+        mock_many.__iter__.return_value = many_layers
+        
+        mock_psd = MagicMock()
+        mock_psd.__iter__.return_value = [mock_layer, mock_group, mock_many]
+        mock_psd.topil.return_value = fake_image()
+        mock_psd_image.open.return_value = mock_psd
+        
+        zip_path = self.output_dir / "test_layers.zip"
+        with zipfile.ZipFile(zip_path, 'w') as zipf:
+            count = psd_processor.extract_layers_from_psd(self.input_dir / "test.psd", None, max_workers=8, zipf=zipf)
+        
+        self.assertEqual(count, 18)
+        with zipfile.ZipFile(zip_path) as z:
+            self.assertEqual(sorted(z.namelist()),
+                             ["Group/Layer_1.png", "Layer.png"] + [f"Many/L{i:02d}.png" for i in range(16)] + ["composite.png"])
+            self.assertEqual(z.read("Group/Layer_1.png"), image_data)
+            # Already-compressed images are not deflated again
+            self.assertEqual(z.getinfo("Layer.png").compress_type, zipfile.ZIP_STORED)
+        # Nothing is written outside the archive
+        self.assertEqual(list(self.output_dir.iterdir()), [zip_path])
+
+    def test_export_file_worker_logic(self):
         # Test the worker logic without actual multiprocessing
         
         psd_path = self.input_dir / "test.psd"
         with open(psd_path, "wb") as f:
             f.write(b"fake psd content")
-            
-        shared_hashes = {}
-        shared_counters = {}
-        shared_processed = {}
-        lock = MagicMock() # Dummy lock
+        
+        hasher = psd_processor._new_hasher()
+        hasher.update(b"fake psd content")
+        actual_hash = hasher.hexdigest()
+        self.assertEqual(psd_processor.hash_file_worker(psd_path), actual_hash)
         
         # 1. Test new file
         with patch('psd_processor.extract_layers_from_psd') as mock_extract:
-            psd_processor.process_file_worker(
-                psd_path, 
-                self.input_dir, 
-                self.output_dir, 
-                False, # no_copy=False
-                shared_hashes, 
-                shared_counters, 
-                shared_processed, 
-                lock
-            )
+            ok = psd_processor.export_file_worker(psd_path, "test.psd", self.output_dir, False)
+            
+            self.assertTrue(ok)
             
             # Verify zip exists
             zip_path = self.output_dir / "test_layers.zip"
@@ -109,8 +223,6 @@ class TestPSDProcessor(unittest.TestCase):
             with zipfile.ZipFile(zip_path, 'r') as z:
                 self.assertIn("test.psd", z.namelist())
             
-            self.assertIn("test", shared_counters)
-            self.assertEqual(shared_counters["test"], 0)
             mock_extract.assert_called()
 
         # 2. Test duplicate file (same content)
@@ -118,51 +230,207 @@ class TestPSDProcessor(unittest.TestCase):
         shutil.rmtree(self.output_dir)
         self.output_dir.mkdir()
         
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(Path(self.test_dir) / "state.json")
+        )
         # Pre-populate hash
-        import hashlib
-        sha = hashlib.sha256()
-        sha.update(b"fake psd content")
-        actual_hash = sha.hexdigest()
-        
-        shared_hashes[actual_hash] = "existing.psd"
+        processor.file_hashes[actual_hash] = "existing.psd"
         
-        with patch('psd_processor.extract_layers_from_psd') as mock_extract:
-            psd_processor.process_file_worker(
-                psd_path, 
-                self.input_dir, 
-                self.output_dir, 
-                False, 
-                shared_hashes, 
-                shared_counters, 
-                shared_processed, 
-                lock
-            )
+        with patch('psd_processor.multiprocessing.Pool', _InlinePool), \
+             patch('psd_processor.extract_layers_from_psd') as mock_extract:
+            processor.process_all()
             
             # Should NOT copy or extract
             self.assertFalse((self.output_dir / "test.psd").exists())
             mock_extract.assert_not_called()
+        self.assertEqual(processor.processed_files[str(psd_path.resolve())][2], actual_hash)
+        # Nothing is written for the duplicate
+        self.assertEqual(list(self.output_dir.iterdir()), [])
+
+    def test_export_name_taken(self):
+        psd_path = self.input_dir / "test.psd"
+        psd_path.write_bytes(b"new content")
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(Path(self.test_dir) / "state.json")
+        )
+        # Another file already holds test.psd, so this one becomes test-1.psd
+        processor.file_hashes["0" * 64] = "test.psd"
+        processor.name_counters["test"] = 0
+        
+        with patch('psd_processor.multiprocessing.Pool', _InlinePool), \
+             patch('psd_processor.extract_layers_from_psd'):
+            processor.process_all()
+        
+        self.assertEqual(processor.file_hashes[psd_processor._hash_file(psd_path)], "test-1.psd")
+        self.assertEqual(list(self.output_dir.iterdir()), [self.output_dir / "test-1_layers.zip"])
+        with zipfile.ZipFile(self.output_dir / "test-1_layers.zip") as z:
+            self.assertEqual(z.namelist(), ["test-1.psd"])
+            self.assertEqual(z.read("test-1.psd"), b"new content")
+
+    def test_fast_copy(self):
+        src = self.input_dir / "big.psd"
+        dst = self.output_dir / "big.psd"
+        data = os.urandom(1024) * (3 * psd_processor.HASH_BLOCK_SIZE // 1024) + b"tail"
+        src.write_bytes(data)
+        os.utime(src, ns=(1_000_000_000, 1_234_567_890_000_000_000))
+        
+        psd_processor._fast_copy(src, dst)
+        
+        self.assertEqual(dst.read_bytes(), data)
+        self.assertEqual(dst.stat().st_mtime_ns, src.stat().st_mtime_ns)
+
+    def test_fast_copy_falls_back_to_copyfile(self):
+        src = self.input_dir / "test.psd"
+        dst = self.output_dir / "test.psd"
+        src.write_bytes(b"fake psd content")
+        
+        # e.g. EXDEV when source and destination are on different filesystems
+        with patch('psd_processor._clonefile', None), \
+             patch('psd_processor.os.copy_file_range', side_effect=OSError("cross-device link"), create=True), \
+             patch('psd_processor.shutil.copyfile', wraps=shutil.copyfile) as mock_copyfile:
+            psd_processor._fast_copy(src, dst)
+        
+        mock_copyfile.assert_called_once_with(src, dst)
+        self.assertEqual(dst.read_bytes(), b"fake psd content")
+        self.assertEqual(dst.stat().st_mtime_ns, src.stat().st_mtime_ns)
+
+    def test_hash_file_algorithms(self):
+        data = b"psd content" * 1000
+        test_file = self.input_dir / "hash.psd"
+        test_file.write_bytes(data)
+        
+        self.assertEqual(psd_processor._hash_file(test_file, "sha256"), hashlib.sha256(data).hexdigest())
+        if psd_processor.blake3 is not None:
+            self.assertEqual(psd_processor._hash_file(test_file, "blake3"), psd_processor.blake3.blake3(data).hexdigest())
+
+    def test_pool_workers_hash_without_mmap(self):
+        # Larger than HASH_BLOCK_SIZE, so the main process would map it
+        data = os.urandom(psd_processor.HASH_BLOCK_SIZE + 12345)
+        test_file = self.input_dir / "big.psd"
+        test_file.write_bytes(data)
+        
+        with patch('psd_processor._in_pool_worker', return_value=True), \
+             patch('psd_processor.mmap.mmap', side_effect=AssertionError("mmap used")):
+            self.assertEqual(psd_processor._hash_file(test_file, "sha256"), hashlib.sha256(data).hexdigest())
+            if psd_processor.blake3 is not None:
+                self.assertEqual(psd_processor._hash_file(test_file, "blake3"),
+                                 psd_processor.blake3.blake3(data).hexdigest())
+
+    def test_process_all_two_stage(self):
+        # Same name with different content, plus a duplicate of the first file
+        (self.input_dir / "sub").mkdir()
+        (self.input_dir / "test.psd").write_bytes(b"one")
+        (self.input_dir / "sub" / "test.psd").write_bytes(b"two")
+        (self.input_dir / "sub" / "copy.psd").write_bytes(b"one")
+        
+        class InlinePool:
+            def __init__(self, processes=None, initializer=None):
+                pass
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                return False
+            def imap_unordered(self, func, iterable, chunksize=1):
+                # Reverse to mimic results arriving out of order
+                return [func(item) for item in reversed(list(iterable))]
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(Path(self.test_dir) / "state.json"),
+            no_copy=True
+        )
+        with patch('psd_processor.multiprocessing.Pool', InlinePool), \
+             patch('psd_processor.export_file_worker', return_value=True) as mock_export:
+            processor.process_all()
+        
+        # Names follow scan order, not completion order; the duplicate is not exported
+        exported = sorted((path.relative_to(self.input_dir).as_posix(), name) for path, name, *_ in
+                          (call.args for call in mock_export.call_args_list))
+        self.assertEqual(exported, [("sub/test.psd", "test-1.psd"), ("test.psd", "test.psd")])
+        self.assertEqual(len(processor.processed_files), 3)
+        copy_entry = processor.processed_files[str((self.input_dir / "sub" / "copy.psd").resolve())]
+        self.assertEqual(processor.file_hashes[copy_entry[2]], "test.psd")
+        self.assertEqual(processor._dirty_count, 0)
+
+    def test_exit_flush_only_registered_while_running(self):
+        (self.input_dir / "x.psd").write_bytes(b"one")
+        
+        class InlinePool:
+            def __init__(self, processes=None, initializer=None):
+                pass
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                return False
+            def imap_unordered(self, func, iterable, chunksize=1):
+                return map(func, iterable)
+        
+        with patch('psd_processor.atexit') as mock_atexit:
+            processor = psd_processor.PSDProcessor(
+                str(self.input_dir), str(self.output_dir), state_file=str(Path(self.test_dir) / "state.json")
+            )
+            mock_atexit.register.assert_not_called()
+            with patch('psd_processor.multiprocessing.Pool', InlinePool), \
+                 patch('psd_processor.export_file_worker', return_value=True):
+                processor.process_all()
+        mock_atexit.register.assert_called_once_with(processor._flush_state)
+        mock_atexit.unregister.assert_called_once_with(processor._flush_state)
+
+    def test_failed_export_keeps_its_name(self):
+        (self.input_dir / "x.psd").write_bytes(b"one")
+        
+        class InlinePool:
+            def __init__(self, processes=None, initializer=None):
+                pass
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                return False
+            def imap_unordered(self, func, iterable, chunksize=1):
+                return map(func, iterable)
+        
+        state_file = str(Path(self.test_dir) / "state.json")
+        processor = psd_processor.PSDProcessor(str(self.input_dir), str(self.output_dir), state_file=state_file)
+        with patch('psd_processor.multiprocessing.Pool', InlinePool), \
+             patch('psd_processor.export_file_worker', return_value=False):
+            processor.process_all()
+        # The name was only reserved, not used up
+        self.assertEqual(processor.name_counters, {})
+        self.assertEqual(processor.processed_files, {})
+        
+        resumed = psd_processor.PSDProcessor(str(self.input_dir), str(self.output_dir), state_file=state_file)
+        with patch('psd_processor.multiprocessing.Pool', InlinePool), \
+             patch('psd_processor.export_file_worker', return_value=True) as mock_export:
+            resumed.process_all()
+        self.assertEqual(mock_export.call_args.args[1], "x.psd")
+        self.assertEqual(resumed.name_counters, {"x": 0})
+
+    def test_export_failure_leaves_no_archive(self):
+        psd_path = self.input_dir / "test.psd"
+        psd_path.write_bytes(b"fake psd content")
+        
+        with patch('psd_processor.extract_layers_from_psd'), \
+             patch('psd_processor._zip_add_file', side_effect=OSError("disk full")):
+            ok = psd_processor.export_file_worker(psd_path, "test.psd", self.output_dir, False)
+        
+        self.assertFalse(ok)
+        self.assertEqual(list(self.output_dir.iterdir()), [])
 
     def test_no_copy_flag(self):
         psd_path = self.input_dir / "test.psd"
         with open(psd_path, "wb") as f:
             f.write(b"fake psd content")
-            
-        shared_hashes = {}
-        shared_counters = {}
-        shared_processed = {}
-        lock = MagicMock()
         
         with patch('psd_processor.extract_layers_from_psd') as mock_extract:
-            psd_processor.process_file_worker(
-                psd_path, 
-                self.input_dir, 
-                self.output_dir, 
-                True, # no_copy=True
-                shared_hashes, 
-                shared_counters, 
-                shared_processed, 
-                lock
-            )
+            ok = psd_processor.export_file_worker(psd_path, "test.psd", self.output_dir, True) # no_copy=True
+            
+            self.assertTrue(ok)
             
             # Should NOT copy file to output root
             self.assertFalse((self.output_dir / "test.psd").exists())
@@ -178,5 +446,309 @@ class TestPSDProcessor(unittest.TestCase):
             # BUT should extract layers
             mock_extract.assert_called()
 
+    def test_export_no_zip(self):
+        psd_path = self.input_dir / "test.psd"
+        psd_path.write_bytes(b"fake psd content")
+        
+        with patch('psd_processor.extract_layers_from_psd') as mock_extract:
+            ok = psd_processor.export_file_worker(psd_path, "test.psd", self.output_dir, False, no_zip=True)
+        
+        self.assertTrue(ok)
+        layer_dir = self.output_dir / "test_layers"
+        # Layers are extracted into the directory instead of an archive
+        self.assertEqual(mock_extract.call_args.args[1], layer_dir)
+        self.assertEqual((layer_dir / "test.psd").read_bytes(), b"fake psd content")
+        self.assertEqual(list(self.output_dir.iterdir()), [layer_dir])
+
+    def test_export_store_psd(self):
+        psd_path = self.input_dir / "test.psd"
+        data = b"fake psd content" * 100000
+        psd_path.write_bytes(data)
+        
+        for store_psd, compress_type in ((True, zipfile.ZIP_STORED), (False, zipfile.ZIP_DEFLATED)):
+            with patch('psd_processor.extract_layers_from_psd'):
+                ok = psd_processor.export_file_worker(psd_path, "test.psd", self.output_dir, False, store_psd=store_psd)
+            
+            self.assertTrue(ok)
+            with zipfile.ZipFile(self.output_dir / "test_layers.zip") as z:
+                info = z.getinfo("test.psd")
+                self.assertEqual(info.compress_type, compress_type)
+                self.assertEqual(z.read("test.psd"), data)
+            if store_psd:
+                self.assertEqual(info.compress_size, len(data))
+
+    def test_unchanged_files_skipped_by_stat(self):
+        psd_path = self.input_dir / "test.psd"
+        with open(psd_path, "wb") as f:
+            f.write(b"fake psd content")
+        file_key = str(psd_path.resolve())
+        
+        # Old state files only listed paths; those entries must be rehashed
+        state_file = Path(self.test_dir) / "state.json"
+        with open(state_file, "w") as f:
+            json.dump({"processed_files": [file_key]}, f)
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file)
+        )
+        self.assertIsNone(processor.processed_files[file_key])
+        self.assertFalse(processor._is_unchanged(file_key, psd_path.stat()))
+        
+        with patch('psd_processor.extract_layers_from_psd') as mock_extract:
+            self.assertTrue(processor.process_file(psd_path))
+            self.assertTrue(processor._is_unchanged(file_key, psd_path.stat()))
+            
+            # Unchanged file is skipped without rehashing or extracting
+            mock_extract.reset_mock()
+            with patch.object(processor, '_calculate_content_hash') as mock_hash:
+                processor.process_file(psd_path)
+                mock_hash.assert_not_called()
+            mock_extract.assert_not_called()
+            
+            # Modified file is processed again
+            with open(psd_path, "ab") as f:
+                f.write(b" edited")
+            self.assertFalse(processor._is_unchanged(file_key, psd_path.stat()))
+            processor.process_file(psd_path)
+            mock_extract.assert_called()
+        
+        # Flushing writes the state file
+        processor._flush_state()
+        self.assertTrue(state_file.exists())
+
+    def test_stat_with_key(self):
+        psd_path = self.input_dir / "test.psd"
+        psd_path.write_bytes(b"fake psd content")
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(Path(self.test_dir) / "state.json")
+        )
+        
+        scanned = processor.input_dir / "test.psd"
+        file_key, st = processor._stat_with_key(scanned)
+        self.assertEqual(file_key, str(psd_path.resolve()))
+        self.assertEqual(st.st_size, len(b"fake psd content"))
+        
+        # Symlinked files are keyed by their target
+        link = processor.input_dir / "link.psd"
+        try:
+            link.symlink_to(psd_path)
+        except OSError:
+            self.skipTest("symlinks not supported")
+        file_key, st = processor._stat_with_key(link)
+        self.assertEqual(file_key, str(psd_path.resolve()))
+        self.assertEqual(st.st_size, len(b"fake psd content"))
+
+    def test_force_hash_rehashes_unchanged_files(self):
+        psd_path = self.input_dir / "test.psd"
+        with open(psd_path, "wb") as f:
+            f.write(b"fake psd content")
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(Path(self.test_dir) / "state.json"),
+            no_copy=True,
+            force_hash=True
+        )
+        
+        with patch('psd_processor.extract_layers_from_psd') as mock_extract:
+            self.assertTrue(processor.process_file(psd_path))
+            mock_extract.assert_called_once()
+            
+            # Stat matches, but the file is hashed again; same content is not re-extracted
+            mock_extract.reset_mock()
+            with patch.object(processor, '_calculate_content_hash', wraps=processor._calculate_content_hash) as mock_hash:
+                self.assertTrue(processor.process_file(psd_path))
+                mock_hash.assert_called_once()
+            mock_extract.assert_not_called()
+
+    def test_process_file_copies_in_hash_pass(self):
+        psd_path = self.input_dir / "test.psd"
+        dup_path = self.input_dir / "copy.psd"
+        for path in (psd_path, dup_path):
+            with open(path, "wb") as f:
+                f.write(b"fake psd content")
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(Path(self.test_dir) / "state.json")
+        )
+        
+        with patch('psd_processor.extract_layers_from_psd'):
+            self.assertTrue(processor.process_file(psd_path))
+            self.assertTrue(processor.process_file(dup_path))
+        
+        # First file copied under its own name, duplicate not copied
+        copied = self.output_dir / "test.psd"
+        self.assertEqual(copied.read_bytes(), b"fake psd content")
+        self.assertEqual(processor.file_hashes[processor._calculate_content_hash(psd_path)], "test.psd")
+        self.assertFalse((self.output_dir / "copy.psd").exists())
+        self.assertEqual([p for p in self.output_dir.iterdir() if p.suffix == ".tmp"], [])
+
+    def test_state_journal_replay(self):
+        psd_path = self.input_dir / "test.psd"
+        with open(psd_path, "wb") as f:
+            f.write(b"fake psd content")
+        file_key = str(psd_path.resolve())
+        state_file = Path(self.test_dir) / "state.json"
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file)
+        )
+        with patch('psd_processor.extract_layers_from_psd'):
+            processor.process_file(psd_path)
+        
+        # Progress is journaled without rewriting the state file
+        self.assertFalse(state_file.exists())
+        self.assertTrue(processor.journal_file.exists())
+        
+        # Simulate a crash: drop the processor without flushing
+        processor._journal.close()
+        processor._journal = None
+        processor._dirty_count = 0
+        
+        resumed = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file)
+        )
+        self.assertTrue(resumed._is_unchanged(file_key, psd_path.stat()))
+        self.assertEqual(resumed.name_counters, {"test": 0})
+        self.assertIn("test.psd", resumed._used_output_names)
+        
+        # Flushing folds the journal into the state file
+        resumed._flush_state()
+        self.assertTrue(state_file.exists())
+        self.assertFalse(resumed.journal_file.exists())
+
+    def test_compact_state_folds_journal(self):
+        psd_path = self.input_dir / "test.psd"
+        psd_path.write_bytes(b"fake psd content")
+        file_key = str(psd_path.resolve())
+        state_file = Path(self.test_dir) / "state.json"
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file)
+        )
+        with patch('psd_processor.extract_layers_from_psd'):
+            processor.process_file(psd_path)
+        # Leave the journal behind as an interrupted run would
+        processor._journal.close()
+        processor._journal = None
+        processor._dirty_count = 0
+        
+        psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file)
+        ).compact_state()
+        
+        self.assertFalse(processor.journal_file.exists())
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.assertEqual(state['processed_files'][file_key][2], psd_processor._hash_file(psd_path))
+        self.assertEqual(state['name_counters'], {"test": 0})
+
+    def test_sigterm_flushes_state(self):
+        for name in ("a.psd", "b.psd"):
+            (self.input_dir / name).write_bytes(name.encode())
+        state_file = Path(self.test_dir) / "state.json"
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file),
+            no_copy=True
+        )
+        
+        exports = []
+        def export(psd_path, *args, **kwargs):
+            exports.append(psd_path)
+            if len(exports) == 2:
+                # As if SIGTERM arrived while the second file was exporting
+                psd_processor._handle_sigterm(signal.SIGTERM, None)
+            return True
+        
+        with patch('psd_processor.multiprocessing.Pool', _InlinePool), \
+             patch('psd_processor.export_file_worker', side_effect=export):
+            with self.assertRaises(SystemExit) as cm:
+                processor.process_all()
+        self.assertEqual(cm.exception.code, 128 + signal.SIGTERM)
+        
+        # The file finished before the signal is saved to the state file
+        self.assertFalse(processor.journal_file.exists())
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.assertEqual(list(state['processed_files']), [str(exports[0].resolve())])
+
+    def test_auto_hasher_keeps_state_algorithm(self):
+        psd_path = self.input_dir / "copy.psd"
+        psd_path.write_bytes(b"fake psd content")
+        state_file = Path(self.test_dir) / "state.json"
+        # A state file from before hash_algorithm was recorded (so sha256)
+        state_file.write_text(json.dumps({
+            "processed_files": {},
+            "file_hashes": {hashlib.sha256(b"fake psd content").hexdigest(): "orig.psd"},
+            "name_counters": {"orig": 0}
+        }))
+        
+        # Even where blake3 would be preferred for new state
+        with patch('psd_processor.HASH_ALGORITHM', 'blake3'):
+            processor = psd_processor.PSDProcessor(
+                str(self.input_dir), str(self.output_dir), state_file=str(state_file), no_copy=True
+            )
+        self.assertEqual(processor.hash_algorithm, "sha256")
+        with patch('psd_processor.extract_layers_from_psd'):
+            self.assertTrue(processor.process_file(psd_path))
+        # Recognised as a duplicate of the recorded content: no new name
+        self.assertEqual(processor.name_counters, {"orig": 0})
+        self.assertEqual(processor.processed_files[str(psd_path.resolve())][2],
+                         hashlib.sha256(b"fake psd content").hexdigest())
+        processor._flush_state()
+        
+        # An explicit, different choice discards the recorded hashes
+        with self.assertLogs(psd_processor.logger, 'WARNING') as logs:
+            switched = psd_processor.PSDProcessor(
+                str(self.input_dir), str(self.output_dir), state_file=str(state_file), hash_algorithm="blake3"
+            )
+        self.assertEqual(switched.hash_algorithm, "blake3")
+        self.assertEqual(switched.file_hashes, {})
+        self.assertIn("duplicates of previously processed content will not be detected", logs.output[0])
+
+    def test_journal_replay_ignores_other_hash_algorithm(self):
+        psd_path = self.input_dir / "test.psd"
+        psd_path.write_bytes(b"fake psd content")
+        state_file = Path(self.test_dir) / "state.json"
+        
+        processor = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file),
+            hash_algorithm="sha256"
+        )
+        with patch('psd_processor.extract_layers_from_psd'):
+            processor.process_file(psd_path)
+        # Crash without flushing, then resume with another hasher
+        processor._journal.close()
+        processor._journal = None
+        processor._dirty_count = 0
+        
+        resumed = psd_processor.PSDProcessor(
+            str(self.input_dir),
+            str(self.output_dir),
+            state_file=str(state_file),
+            hash_algorithm="blake3"
+        )
+        self.assertIn(str(psd_path.resolve()), resumed.processed_files)
+        self.assertEqual(resumed.file_hashes, {})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
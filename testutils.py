@@ -0,0 +1,17 @@
+"""Filesystem helpers shared by the test modules."""
+
+import os
+
+def fast_rmtree(path):
+    """Remove a directory tree with plain scandir/unlink/rmdir calls."""
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                fast_rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+    os.rmdir(path)
+
+def fast_touch(path):
+    """Create an empty file; unlike Path.touch, no utime call is attempted first."""
+    os.close(os.open(path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644))